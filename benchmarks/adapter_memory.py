@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the memory used by representative adapter workloads.
+
+Usage: PYTHONPATH=. python3 benchmarks/adapter_memory.py [--units N]
+                                                        [--adapters N]
+
+Each workload runs in its own process so that its peak RSS is not mixed
+with the others'. The peak RSS includes the interpreter and the modules
+loaded, 'baseline' shows what that amounts to.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import tracemalloc
+
+import ops_openstack.adapters as adapters
+
+from fakes import make_charm, make_interface
+
+
+def baseline(args):
+    return []
+
+
+def relation_adapters(args):
+    charm = make_charm(200)
+    interfaces = [make_interface('rel{}'.format(i), 20)
+                  for i in range(args.adapters)]
+    return [adapters.OpenStackRelationAdapters(interfaces, charm)
+            for _ in range(10)]
+
+
+def aggregate(args):
+    units = [
+        {'private-address': '10.0.{}.{}'.format(i // 250, i % 250),
+         'hostname': 'host-{}'.format(i),
+         'weight': str(i % 10)}
+        for i in range(args.units)]
+    adapter = adapters.OpenStackAggregateRelationAdapter(
+        make_interface('cluster', 0, units))
+    adapter.addresses
+    return [adapter]
+
+
+def to_context(args):
+    return [context.to_context() for context in relation_adapters(args)]
+
+
+WORKLOADS = [baseline, relation_adapters, aggregate, to_context]
+
+
+def _run(workload, args, queue):
+    tracemalloc.start()
+    kept = workload(args)
+    _, peak = tracemalloc.get_traced_memory()
+    queue.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, peak))
+    del kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--units', type=int, default=5000,
+                        help='remote units in the aggregate workload')
+    parser.add_argument('--adapters', type=int, default=50,
+                        help='relations in the adapters workloads')
+    args = parser.parse_args()
+
+    print('{:<20} {:>12} {:>16}'.format(
+        'workload', 'peak RSS KiB', 'traced peak KiB'))
+    for workload in WORKLOADS:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_run, args=(workload, args, queue))
+        process.start()
+        process.join()
+        if process.exitcode:
+            raise SystemExit('{} failed'.format(workload.__name__))
+        rss, peak = queue.get()
+        print('{:<20} {:>12} {:>16.0f}'.format(
+            workload.__name__, rss, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
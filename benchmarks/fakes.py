@@ -0,0 +1,63 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fake charms and interfaces shared by the adapter benchmarks."""
+
+import collections
+import types
+
+Unit = collections.namedtuple('Unit', ['name'])
+
+
+class FakeCharm(object):
+
+    def __init__(self, config):
+        self.framework = types.SimpleNamespace(
+            model=types.SimpleNamespace(config=config))
+
+
+def make_charm(options):
+    """Charm with options named 'option-<n>'.
+
+    :param options: Number of options.
+    :type options: int
+    :rtype: FakeCharm
+    """
+    return FakeCharm({'option-{}'.format(i): i for i in range(options)})
+
+
+def make_interface(name, keys, units=()):
+    """Interface with properties 'key<n>' and a relation to units.
+
+    :param name: Endpoint name.
+    :type name: str
+    :param keys: Number of properties.
+    :type keys: int
+    :param units: Relation data of each remote unit.
+    :type units: Iterable[Dict[str, str]]
+    """
+    def _property(index):
+        return property(lambda self: self.data['key{}'.format(index)])
+    attrs = {'key{}'.format(i): _property(i) for i in range(keys)}
+    interface = type('Interface', (object,), attrs)()
+    interface.endpoint_name = name
+    interface.data = {'key{}'.format(i): str(i) for i in range(keys)}
+    units = list(units)
+    relation = types.SimpleNamespace(
+        units=[Unit('peer/{}'.format(i)) for i in range(len(units))],
+        data={})
+    for unit, data in zip(relation.units, units):
+        relation.data[unit] = data
+    interface.model = types.SimpleNamespace(relations={name: [relation]})
+    return interface
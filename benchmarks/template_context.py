@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare rendering a template from adapters and from to_context().
+
+Usage: PYTHONPATH=. python3 benchmarks/template_context.py [--keys N]
+                                                         [--lines N]
+
+Requires jinja2.
+"""
+
+import argparse
+import timeit
+
+import jinja2
+
+import ops_openstack.adapters as adapters
+
+from fakes import make_charm, make_interface
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=50,
+                        help='properties per adapter')
+    parser.add_argument('--lines', type=int, default=2000,
+                        help='template lines, each with two lookups')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    source = '\n'.join(
+        'line{0} = {{{{ amqp.key{1} }}}} {{{{ options.option_{1} }}}}'.format(
+            line, line % args.keys)
+        for line in range(args.lines))
+    template = jinja2.Environment().from_string(source)
+    charm = make_charm(args.keys)
+    interface = make_interface('amqp', args.keys)
+
+    def render_adapters():
+        return template.render(
+            **dict(adapters.OpenStackRelationAdapters([interface], charm)))
+
+    def render_context():
+        context = adapters.OpenStackRelationAdapters(
+            [interface], charm).to_context()
+        return template.render(**context)
+
+    assert render_adapters() == render_context()
+    for name, func in [('adapters', render_adapters),
+                       ('to_context()', render_context)]:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('{:<14} {:8.2f} ms'.format(name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,10 @@
 """Adapter classes and utilities for use with Reactive interfaces"""
 from __future__ import absolute_import
 
+import collections
+import functools
+import keyword
+import types
 import weakref
 
 from ops.framework import Object
@@ -31,6 +35,10 @@ class OpenStackOperRelationAdapter(object):
     The generic type of the interface the adapter is wrapping.
     """
 
+    _reserved_properties = frozenset()
+
+    __slots__ = ('relation',)
+
     def __init__(self, relation):
         """Class will usually be initialised using the 'relation' option to
            pass in an instance of a interface class. If there is no relation
@@ -62,7 +70,8 @@ class OpenStackOperRelationAdapter(object):
         interface_instance_names = dir(self.relation)
         property_names = [
             p for p in interface_instance_names if isinstance(
-                getattr(type(self.relation), p, None), property)]
+                getattr(type(self.relation), p, None), property) and
+            p not in self._reserved_properties]
         for name in property_names:
             # The double lamda trick is necessary to ensure we get fresh
             # data from the interface class property at every call to the
@@ -75,6 +84,130 @@ class OpenStackOperRelationAdapter(object):
                             self.relation, name)))(name))
 
 
+def _unit_sort_key(unit_name):
+    app, _, number = unit_name.rpartition('/')
+    return (app, int(number)) if number.isdigit() else (unit_name, -1)
+
+
+class OpenStackAggregateRelationAdapter(OpenStackOperRelationAdapter):
+    """
+    Adapter presenting the data of all remote units of a relation.
+
+    The relation data of every remote unit, across all relations of the
+    endpoint, is read once, on first access, and kept in columns: a sorted
+    list of unit names and, for each key set by any unit, the list of values
+    in the same order. Templates can then use the views directly, e.g:
+
+        {% for address in cluster.addresses %}
+        server {{ address }}
+        {% endfor %}
+
+    To use it, map the relation to this class in relation_adapters.
+    """
+
+    address_keys = ('ingress-address', 'private-address')
+    """
+    Relation data keys holding a unit's address, in order of preference.
+    """
+
+    # Views not to be replaced by interface properties of the same name.
+    _reserved_properties = frozenset(['units', 'addresses', 'columns'])
+
+    __slots__ = ('_views',)
+
+    def __init__(self, relation):
+        """
+        :param relation: Instance of an interface class, an ops Object for
+                         the endpoint.
+        """
+        super().__init__(relation)
+        self._views = None
+
+    def _relations(self):
+        try:
+            name = self.relation.endpoint_name
+        except AttributeError:
+            name = self.relation.relation_name
+        return self.relation.model.relations[name]
+
+    def _build_views(self):
+        rows = {}
+        for relation in self._relations():
+            for unit in relation.units:
+                rows[unit.name] = dict(relation.data[unit])
+        units = sorted(rows, key=_unit_sort_key)
+        columns = {}
+        for index, unit in enumerate(units):
+            for key, value in rows[unit].items():
+                if key not in columns:
+                    columns[key] = [None] * len(units)
+                columns[key][index] = value
+        addresses = []
+        for unit in units:
+            for key in self.address_keys:
+                if rows[unit].get(key):
+                    addresses.append(rows[unit][key])
+                    break
+        self._views = {
+            'units': units,
+            'rows': rows,
+            'columns': columns,
+            'addresses': addresses}
+        return self._views
+
+    def _view(self, name):
+        return (self._views or self._build_views())[name]
+
+    def refresh(self):
+        """Drop the views so that relation data is read again."""
+        self._views = None
+
+    @property
+    def units(self):
+        """Names of the remote units, sorted by application and number.
+
+        :rtype: List[str]
+        """
+        return self._view('units')
+
+    @property
+    def addresses(self):
+        """Address of each remote unit that has published one, see
+        address_keys, in the order of units.
+
+        :rtype: List[str]
+        """
+        return self._view('addresses')
+
+    @property
+    def columns(self):
+        """For each key set by any remote unit, the value set by each unit,
+        None if unset, in the order of units.
+
+        :rtype: Dict[str, List[Optional[str]]]
+        """
+        return self._view('columns')
+
+    def values(self, key):
+        """Value of key set by each remote unit, in the order of units.
+
+        :param key: Relation data key
+        :type key: str
+        :rtype: List[Optional[str]]
+        """
+        return self.columns.get(key, [None] * len(self.units))
+
+    def unit_data(self, unit_name):
+        """Relation data of a remote unit.
+
+        :param unit_name: Unit name, e.g. 'keystone/0'
+        :type unit_name: str
+        :rtype: Dict[str, str]
+        :raises: KeyError if the unit is not related.
+        """
+        return self._view('rows')[unit_name]
+
+
 # Adapted from charms_openstack.adapters
 class ConfigurationAdapter(object):
     """
@@ -86,8 +219,9 @@ class ConfigurationAdapter(object):
     adapter can query the charm class for global config (e.g. service_name).
 
 
-    The configuration items from Juju are copied over and the '-' are replaced
-    with '_'.  This allows them to be used directly on the instance.
+    The configuration items from Juju are copied over and are available as
+    attributes with the '-' replaced with '_'.  This allows them to be used
+    directly on the instance.
     """
 
     def __init__(self, charm_instance):
@@ -97,9 +231,35 @@ class ConfigurationAdapter(object):
             class.
         """
         self.charm_instance = weakref.proxy(charm_instance)
-        for k, v in charm_instance.framework.model.config.items():
-            k = k.replace('-', '_')
-            setattr(self, k, v)
+        self._config = dict(charm_instance.framework.model.config)
+        self._keys = _option_keys(frozenset(self._config))
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('_config', '_keys'):
+            raise AttributeError(name)
+        try:
+            return self._config[self._keys[name]]
+        except KeyError:
+            raise AttributeError(
+                '{!r} object has no attribute {!r}'.format(
+                    type(self).__name__, name)) from None
+
+
+@functools.lru_cache(maxsize=None)
+def _option_keys(keys):
+    """Map attribute names to the options they refer to.
+
+    The map is shared by the adapters of charms with the same options.
+
+    :param keys: Option keys.
+    :type keys: FrozenSet[str]
+    :returns: Option keys by their name with '-' replaced with '_'.
+    :rtype: Dict[str, str]
+    """
+    names = {key.replace('-', '_'): key for key in keys}
+    # An option's own name wins over another's with '-' replaced.
+    names.update((key, key) for key in keys)
+    return names
 
 
 # Adapted from charms_openstack.adapters
@@ -188,3 +348,71 @@ class OpenStackRelationAdapters(Object):
         except KeyError:
             adapter = OpenStackOperRelationAdapter(relation)
         return relation_name, adapter
+
+    def to_context(self, keys=None):
+        """Snapshot the adapters into a template context.
+
+        Each adapter's values are resolved once, into a named tuple, so that
+        rendering uses plain attribute lookups rather than going through the
+        adapters' dynamic properties. Templates use the context as they do
+        the adapters, e.g:
+
+            {{ amqp.private_address }}
+
+        :param keys: Keys the templates use, as '<adapter>.<name>', e.g.
+                     ['amqp.private_address', 'options.debug']. By default
+                     every property of every adapter is resolved, leaving
+                     out options whose names are not valid identifiers once
+                     '-' is replaced with '_'.
+        :type keys: Optional[Iterable[str]]
+        :returns: Read-only mapping of adapter name to a named tuple of its
+                  values.
+        :rtype: types.MappingProxyType
+        """
+        if keys is None:
+            wanted = {name: _adapter_keys(adapter) for name, adapter in self}
+        else:
+            wanted = collections.defaultdict(list)
+            for key in keys:
+                name, _, attr = key.partition('.')
+                wanted[name].append(attr)
+        context = {}
+        for name, attrs in wanted.items():
+            adapter = getattr(self, name)
+            attrs = tuple(dict.fromkeys(attrs))
+            context[name] = _snapshot_type(attrs)(
+                *(_freeze(getattr(adapter, attr)) for attr in attrs))
+        return types.MappingProxyType(context)
+
+
+def _adapter_keys(adapter):
+    """Names of the values an adapter presents to templates.
+
+    :param adapter: Relation or configuration adapter.
+    :type adapter: object
+    :rtype: List[str]
+    """
+    keys = [
+        name for name in dir(type(adapter))
+        if not name.startswith('_') and
+        isinstance(getattr(type(adapter), name), property)]
+    if isinstance(adapter, ConfigurationAdapter):
+        # Properties of subclasses take precedence over options of the same
+        # name, as they do on the adapter.
+        keys.extend(
+            name for name in (key.replace('-', '_') for key in adapter._config)
+            if name.isidentifier() and not keyword.iskeyword(name))
+    return list(dict.fromkeys(keys))
+
+
+@functools.lru_cache(maxsize=None)
+def _snapshot_type(fields):
+    return collections.namedtuple('AdapterSnapshot', fields)
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(value, dict):
+        return types.MappingProxyType(value)
+    return value
@@ -0,0 +1,139 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Asyncio facade for blocking charmhelpers calls.
+
+The charmhelpers functions used by this library run blocking subprocesses.
+The coroutines here run them in a thread pool so that independent calls can
+be awaited concurrently, with at most MAX_CONCURRENCY running at once:
+
+    async def check_payload(self):
+        (_, services_msg), release = await aio.gather(
+            aio.ows_check_services_running(self.services(), ports=[]),
+            aio.get_os_codename_install_source('distro'),
+            deadline=time.monotonic() + 30)
+
+Synchronous code runs a coroutine to completion with run(). Subprocesses
+already started when a deadline passes are not killed, but their results are
+discarded and no further calls are started. A deadline only stops the caller
+waiting: the thread pool's threads are joined when the interpreter exits, so
+the hook still lasts until the calls started before the deadline return.
+"""
+
+import asyncio
+import functools
+import time
+import weakref
+
+import charmhelpers.contrib.openstack.utils as os_utils
+import ops_openstack.fetch as fetch
+
+MAX_CONCURRENCY = 4
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _semaphore(loop):
+    # asyncio primitives are bound to the loop they are created in.
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _semaphores[loop]
+
+
+async def call(func, *args, **kwargs):
+    """Run a blocking function in the thread pool.
+
+    Once started the function runs to completion, even if the coroutine is
+    cancelled.
+
+    :param func: Function to call with args and kwargs.
+    :type func: Callable
+    :returns: The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    async with _semaphore(loop):
+        return await loop.run_in_executor(
+            None, functools.partial(func, *args, **kwargs))
+
+
+async def gather(*aws, deadline=None):
+    """Await several awaitables concurrently.
+
+    :param aws: Coroutines or futures to await.
+    :type aws: Awaitable
+    :param deadline: time.monotonic() value by which all must complete.
+    :type deadline: Optional[float]
+    :returns: Results, in the order the awaitables were passed.
+    :rtype: List[any]
+    :raises: asyncio.TimeoutError if the deadline passes, in which case the
+             outstanding awaitables are cancelled.
+    """
+    gathered = asyncio.gather(*aws)
+    if deadline is None:
+        return await gathered
+    return await asyncio.wait_for(
+        gathered, timeout=max(deadline - time.monotonic(), 0))
+
+
+def run(aw, deadline=None):
+    """Run an awaitable to completion from synchronous code.
+
+    :param aw: Coroutine or future to run.
+    :type aw: Awaitable
+    :param deadline: time.monotonic() value by which it must complete.
+    :type deadline: Optional[float]
+    :returns: The awaitable's result.
+    :raises: asyncio.TimeoutError if the deadline passes, calls already
+             running in the thread pool are left to complete in the
+             background, see call().
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        if deadline is not None:
+            aw = asyncio.wait_for(
+                aw, timeout=max(deadline - time.monotonic(), 0))
+        return loop.run_until_complete(aw)
+    finally:
+        loop.close()
+
+
+async def apt_update(fatal=False):
+    """See ops_openstack.fetch.apt_update()."""
+    return await call(fetch.apt_update, fatal=fatal)
+
+
+async def apt_install(packages, options=None, fatal=False):
+    """See ops_openstack.fetch.apt_install()."""
+    return await call(
+        fetch.apt_install, packages, options=options, fatal=fatal)
+
+
+async def manage_payload_services(action, services=None, charm_func=None):
+    """See charmhelpers.contrib.openstack.utils.manage_payload_services()."""
+    return await call(
+        os_utils.manage_payload_services, action,
+        services=services, charm_func=charm_func)
+
+
+async def ows_check_services_running(services, ports):
+    """See charmhelpers.contrib.openstack.utils.ows_check_services_running().
+    """
+    return await call(
+        os_utils.ows_check_services_running, services, ports=ports)
+
+
+async def get_os_codename_install_source(src):
+    """See charmhelpers.contrib.openstack.utils.get_os_codename_install_source().
+    """  # noqa
+    return await call(os_utils.get_os_codename_install_source, src)
@@ -0,0 +1,262 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Validation and change tracking of charm configuration."""
+
+import hashlib
+import json
+
+
+def config_digest(config):
+    """Return a digest identifying the contents of a charm config.
+
+    :param config: Charm configuration
+    :type config: Mapping[str, any]
+    :returns: Hex digest
+    :rtype: str
+    """
+    return hashlib.sha256(
+        json.dumps(dict(config), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _coerce_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('true', 'yes', '1'):
+        return True
+    if str(value).lower() in ('false', 'no', '0'):
+        return False
+    raise ValueError("not a boolean")
+
+
+class ConfigOption(object):
+    """Declaration of a single charm configuration option.
+
+    Example::
+
+        CONFIG_SCHEMA = {
+            'port': ConfigOption(int, minimum=1, maximum=65535),
+            'log-level': ConfigOption(str, choices=['debug', 'info']),
+            'driver': ConfigOption(str, required=True),
+        }
+    """
+
+    def __init__(self, option_type=str, required=False, choices=None,
+                 minimum=None, maximum=None):
+        """
+        :param option_type: Type, or callable raising ValueError, used to
+                            coerce the value.
+        :type option_type: Callable[[any], any]
+        :param required: Whether the option must be set.
+        :type required: bool
+        :param choices: Values the option is restricted to.
+        :type choices: Optional[List[any]]
+        :param minimum: Smallest value allowed.
+        :type minimum: Optional[any]
+        :param maximum: Largest value allowed.
+        :type maximum: Optional[any]
+        """
+        self.option_type = option_type
+        self.required = required
+        self.choices = choices
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def compile(self):
+        """Compile the option into a list of checks to apply in turn.
+
+        Each check takes the value and returns it, possibly coerced, or
+        raises ValueError with a description of the problem.
+
+        :returns: Checks for the option
+        :rtype: List[Callable[[any], any]]
+        """
+        checks = []
+        coerce = _coerce_bool if self.option_type is bool else \
+            self.option_type
+
+        def _coerce(value):
+            try:
+                return coerce(value)
+            except (TypeError, ValueError):
+                raise ValueError("invalid value '{}'".format(value))
+        checks.append(_coerce)
+
+        if self.choices is not None:
+            choices = frozenset(self.choices)
+
+            def _choices(value):
+                if value not in choices:
+                    raise ValueError("must be one of {}".format(
+                        ', '.join(str(c) for c in self.choices)))
+                return value
+            checks.append(_choices)
+        if self.minimum is not None:
+            def _minimum(value):
+                if value < self.minimum:
+                    raise ValueError("must be at least {}".format(
+                        self.minimum))
+                return value
+            checks.append(_minimum)
+        if self.maximum is not None:
+            def _maximum(value):
+                if value > self.maximum:
+                    raise ValueError("must be at most {}".format(
+                        self.maximum))
+                return value
+            checks.append(_maximum)
+        return checks
+
+
+class ConfigValidationResult(object):
+    """Outcome of validating a charm configuration."""
+
+    def __init__(self, values, missing, errors):
+        """
+        :param values: Coerced values of the options set.
+        :type values: Dict[str, any]
+        :param missing: Names of required options which are not set.
+        :type missing: List[str]
+        :param errors: Description of each invalid option or rule.
+        :type errors: List[str]
+        """
+        self.values = values
+        self.missing = missing
+        self.errors = errors
+
+    def __bool__(self):
+        return not (self.missing or self.errors)
+
+    @property
+    def message(self):
+        """Status message describing all the problems found.
+
+        :rtype: str
+        """
+        messages = []
+        if self.missing:
+            messages.append('Missing option(s): ' + ','.join(self.missing))
+        if self.errors:
+            messages.append(
+                'Invalid configuration: ' + '; '.join(self.errors))
+        return ', '.join(messages)
+
+
+class ConfigValidator(object):
+    """Validator compiled from a config schema.
+
+    All options are checked in a single pass and every problem found is
+    reported, rather than stopping at the first one. Results are not cached
+    here, OSBaseCharm.validate_config() caches them for the hook.
+    """
+
+    def __init__(self, schema=None, mandatory=None, rules=None):
+        """
+        :param schema: Options to validate, keyed by name.
+        :type schema: Optional[Dict[str, ConfigOption]]
+        :param mandatory: Names of options which must be set.
+        :type mandatory: Optional[List[str]]
+        :param rules: Cross-field checks, each taking the coerced values and
+                      returning an error message or None.
+        :type rules: Optional[List[Callable[[Dict[str, any]], Optional[str]]]]
+        """
+        schema = dict(schema or {})
+        for name in mandatory or []:
+            if name not in schema:
+                schema[name] = ConfigOption(lambda value: value)
+        self._required = [
+            name for name, option in sorted(schema.items())
+            if option.required or name in (mandatory or [])]
+        self._checks = [
+            (name, option.compile())
+            for name, option in sorted(schema.items())]
+        self._rules = list(rules or [])
+
+    def validate(self, config):
+        """Validate a charm configuration.
+
+        :param config: Charm configuration
+        :type config: Mapping[str, any]
+        :returns: Result of the validation
+        :rtype: ConfigValidationResult
+        """
+        values = dict(config)
+        missing = [
+            name for name in self._required if values.get(name) is None]
+        errors = []
+        for name, checks in self._checks:
+            value = values.get(name)
+            if value is None:
+                continue
+            try:
+                for check in checks:
+                    value = check(value)
+            except ValueError as e:
+                errors.append('{}: {}'.format(name, e))
+                continue
+            values[name] = value
+        if not (missing or errors):
+            for rule in self._rules:
+                error = rule(values)
+                if error:
+                    errors.append(error)
+        return ConfigValidationResult(values, missing, errors)
+
+
+class ConfigDelta(object):
+    """Difference between the last applied and the current charm config."""
+
+    def __init__(self, previous, current):
+        """
+        :param previous: Config last applied, None if there is none.
+        :type previous: Optional[Mapping[str, any]]
+        :param current: Current charm config.
+        :type current: Mapping[str, any]
+        """
+        self.initial = previous is None
+        previous = dict(previous or {})
+        current = dict(current)
+        self.added = set(current) - set(previous)
+        self.removed = set(previous) - set(current)
+        self.changed = set(
+            k for k in set(current) & set(previous)
+            if current[k] != previous[k])
+
+    @property
+    def keys(self):
+        """Names of all the options added, removed or changed.
+
+        :rtype: Set[str]
+        """
+        return self.added | self.removed | self.changed
+
+    def affects(self, keys):
+        """Whether any of the given options differ.
+
+        Everything is affected when there is no previously applied config.
+
+        :param keys: Option names
+        :type keys: Iterable[str]
+        :rtype: bool
+        """
+        return self.initial or bool(self.keys.intersection(keys))
+
+    def __bool__(self):
+        return self.initial or bool(self.keys)
+
+    def __repr__(self):
+        return ('ConfigDelta(initial={}, added={}, removed={}, '
+                'changed={})'.format(
+                    self.initial, sorted(self.added), sorted(self.removed),
+                    sorted(self.changed)))
@@ -12,78 +12,246 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import inspect
+import io
+import json
+
 from ops.charm import CharmBase
 from ops.framework import (
     StoredState,
 )
 
-from charmhelpers.fetch import (
+from ops_openstack.config import (
+    ConfigDelta,
+    ConfigValidator,
+    config_digest,
+)
+from ops_openstack.fetch import (
     apt_install,
     apt_update,
-    add_source,
+)
+from ops_openstack.history import (
+    EVALUATION,
+    HOOK,
+    StatusHistory,
 )
 from ops.model import (
     ActiveStatus,
     BlockedStatus,
     MaintenanceStatus,
+    StatusBase,
     WaitingStatus,
 )
-import charmhelpers.core.hookenv as hookenv
-import charmhelpers.contrib.openstack.utils as os_utils
+import ops_openstack.dpkg as dpkg
+import ops_openstack.releases as releases
 import logging
+import os
+import pathlib
+import time
+
+from ops_openstack.lazy import lazy_import
 
-# Stolen from charms.ceph
-UCA_CODENAME_MAP = {
-    'icehouse': 'firefly',
-    'juno': 'firefly',
-    'kilo': 'hammer',
-    'liberty': 'hammer',
-    'mitaka': 'jewel',
-    'newton': 'jewel',
-    'ocata': 'jewel',
-    'pike': 'luminous',
-    'queens': 'luminous',
-    'rocky': 'mimic',
-    'stein': 'mimic',
-    'train': 'nautilus',
-    'ussuri': 'octopus',
-    'victoria': 'octopus',
-    'wallaby': 'pacific',
-    'xena': 'pacific',
-    'yoga': 'quincy',
-    'zed': 'quincy',
-    'antelope': 'quincy',
-    'bobcat': 'reef',
-    'caracal': 'squid',
-    'dalmatian': 'squid',
-    'epoxy': 'squid',
-}
+# Only needed by some hooks, see OSBaseCharm.FAST_DISPATCH_HOOKS.
+aio = lazy_import('ops_openstack.aio')
+asyncio = lazy_import('asyncio')
+ch_fetch = lazy_import('charmhelpers.fetch')
+cProfile = lazy_import('cProfile')
+futures = lazy_import('concurrent.futures')
+hookenv = lazy_import('charmhelpers.core.hookenv')
+os_utils = lazy_import('charmhelpers.contrib.openstack.utils')
+probes = lazy_import('ops_openstack.probes')
+pstats = lazy_import('pstats')
+templating = lazy_import('ops_openstack.templating')
+trace = lazy_import('ops_openstack.trace')
+tracemalloc = lazy_import('tracemalloc')
 
+UCA_CODENAME_MAP = releases.UCA_CODENAME_MAP
+
+APT_ARCHIVES = '/var/cache/apt/archives'
+
+# Hook profiles are kept under the first of these which exists, out of the
+# charm directory which upgrade-charm replaces.
+PROFILE_ROOTS = ('/var/lib/juju', '/tmp')
+
+# Cost classes of status checks, see OSBaseCharm.register_status_check()
+CHEAP_CHECK = 'cheap'
+EXPENSIVE_CHECK = 'expensive'
 
 _releases = {}
 logger = logging.getLogger(__name__)
 
 
+def _apt_archive_size(path=APT_ARCHIVES):
+    """Return the total size of the packages held in the apt cache.
+
+    :param path: Directory apt downloads packages to.
+    :type path: str
+    :returns: Size in bytes.
+    :rtype: int
+    """
+    try:
+        return sum(
+            entry.stat().st_size
+            for entry in os.scandir(path)
+            if entry.name.endswith('.deb'))
+    except OSError:
+        return 0
+
+
+def coalesce(handler):
+    """Mark an event handler as coalescable.
+
+    Relation data read in a hook always reflects the latest state, so when a
+    handler is invoked several times for the same relation within one hook
+    execution, for instance for deferred events re-emitted ahead of the
+    current one, only the first invocation needs to run. Later ones are
+    dropped and counted in the charm's coalesced_events stored state.
+
+    Coalescing is scoped to a Juju hook context, outside of one, for instance
+    under ops.testing.Harness, every event is handled.
+
+    Example::
+
+    class MyCharm(OSBaseCharm):
+
+        @coalesce
+        def on_peers_changed(self, event):
+            ...
+    """
+    @functools.wraps(handler)
+    def wrapper(self, event):
+        if not os.environ.get('JUJU_CONTEXT_ID'):
+            return handler(self, event)
+        relation = getattr(event, 'relation', None)
+        key = (handler.__name__, relation.id if relation else None)
+        if key in self._coalesce_seen:
+            counts = self._stored.coalesced_events
+            counts[handler.__name__] = counts.get(handler.__name__, 0) + 1
+            logger.debug("Coalesced %s into earlier %s", event, key[0])
+            return
+        handler(self, event)
+        if not event.deferred:
+            self._coalesce_seen.add(key)
+    return wrapper
+
+
 class OSBaseCharm(CharmBase):
     _stored = StoredState()
 
     PACKAGES = []
 
+    # Package the workload version is read from on each status update, the
+    # version is left to the charm if None.
+    VERSION_PACKAGE = None
+
     RESTART_MAP = {}
 
+    # Options each file in RESTART_MAP is rendered from, files not listed
+    # are taken to depend on every option. Used by plan_config().
+    CONFIG_FILE_OPTIONS = {}
+
     REQUIRED_RELATIONS = []
 
     MANDATORY_CONFIG = []
 
+    CONFIG_SCHEMA = {}
+
+    CONFIG_RULES = []
+
+    SERIES_UPGRADE_WORKERS = 4
+
+    # Seconds after prefetching packages for which install_pkgs() reuses
+    # the package index refreshed by the prefetch.
+    PREFETCH_MAX_AGE = 6 * 60 * 60
+
+    PROFILE_KEEP = 10
+
+    TRACE_KEEP = 10
+
+    # Number of allocation sites listed in hook memory reports.
+    MEMORY_REPORT_TOP = 10
+
+    # Seconds a hook is expected to complete in, see run_work().
+    HOOK_BUDGET = 300
+
+    # Times deferred work is run again after failing before it is dropped.
+    WORK_RETRIES = 3
+
+    # Load average per CPU below which expensive status checks run early.
+    IDLE_LOAD = 0.25
+
+    # Peer relation the leader shares application-wide values over, see
+    # shared_value().
+    PEER_RELATION = None
+
+    # Hooks which only need a light setup, see fast_dispatch.
+    FAST_DISPATCH_HOOKS = ('update-status',)
+
     def __init__(self, framework):
+        self._hook_start = time.time()
         super().__init__(framework)
         self.custom_status_checks = []
-        self._stored.set_default(is_started=False)
-        self._stored.set_default(is_paused=False)
-        self._stored.set_default(series_upgrade=False)
-        self.framework.observe(self.on.install, self.on_install)
+        self._latency_probes = []
+        self._status_check_schedule = {}
+        self._config_validator = None
+        self._config_validation = None
+        self._config_observers = []
+        self.config_delta = None
+        self._coalesce_seen = set()
+        self._profiler = None
+        self._recorder = None
+        self._trace = None
+        self._tracing_memory = False
+        self._hook_selection = {}
+        self._shared = {}
+        self._planning = False
+        self._work = {}
+        self._deferred_work_run = False
+        self._checkpointing = False
+        self._stored_names = set()
+        self.set_stored_defaults(is_started=False)
+        self.set_stored_defaults(is_paused=False)
+        self.set_stored_defaults(series_upgrade=False)
+        self.set_stored_defaults(series_upgrade_checkpoints={})
+        self.set_stored_defaults(series_upgrade_timings={})
+        self.set_stored_defaults(prefetched_source=None)
+        self.set_stored_defaults(prefetched_time=None)
+        self.set_stored_defaults(applied_config=None)
+        self.set_stored_defaults(coalesced_events={})
+        self.set_stored_defaults(workload_version=None)
+        self.set_stored_defaults(status_check_results={})
+        self.set_stored_defaults(deferred_work=[])
+        self.set_stored_defaults(work_durations={})
+        self.set_stored_defaults(work_failures={})
         self.framework.observe(self.on.update_status, self.on_update_status)
+        self.framework.observe(
+            self.framework.on.pre_commit, self._on_pre_commit)
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+        self.register_status_check(self.check_config)
+        self._observe_events()
+        self._start_memory_report()
+        self._start_profiling()
+        self._start_recording()
+
+    @property
+    def fast_dispatch(self):
+        """Whether the hook being run is one of FAST_DISPATCH_HOOKS.
+
+        Charms can check this property to skip setup these hooks, by default
+        update-status, do not need. Observers must still be registered for
+        all events, as previously deferred events are re-emitted before the
+        hook's own event and are dropped if nothing observes them. Modules
+        these hooks do not use are imported lazily.
+
+        :rtype: bool
+        """
+        return os.environ.get('JUJU_HOOK_NAME') in self.FAST_DISPATCH_HOOKS
+
+    def _observe_events(self):
+        self.framework.observe(self.on.install, self.on_install)
         self.framework.observe(self.on.config_changed, self._on_config)
+        self.framework.observe(self.on.upgrade_charm, self._on_upgrade_charm)
         # A charm may not have pause/resume actions if it does not manage a
         # daemon.
         try:
@@ -98,29 +266,402 @@ class OSBaseCharm(CharmBase):
                 self.on_resume_action)
         except AttributeError:
             pass
+        try:
+            self.framework.observe(
+                self.on.prefetch_packages_action,
+                self.on_prefetch_packages_action)
+        except AttributeError:
+            pass
+        try:
+            self.framework.observe(
+                self.on.profile_report_action,
+                self.on_profile_report_action)
+        except AttributeError:
+            pass
+        try:
+            self.framework.observe(
+                self.on.status_history_action,
+                self.on_status_history_action)
+        except AttributeError:
+            pass
+        try:
+            self.framework.observe(
+                self.on.plan_config_action,
+                self.on_plan_config_action)
+        except AttributeError:
+            pass
         self.framework.observe(self.on.pre_series_upgrade,
                                self.on_pre_series_upgrade)
         self.framework.observe(self.on.post_series_upgrade,
                                self.on_post_series_upgrade)
 
+    def set_stored_defaults(self, **kwargs):
+        """Set the default value of stored state attributes.
+
+        Attributes given a default here are included in hook traces, see
+        _start_recording().
+        """
+        self._stored.set_default(**kwargs)
+        self._stored_names.update(kwargs)
+
     def install_pkgs(self):
         logging.info("Installing packages")
-        if self.model.config.get('source'):
-            add_source(
+        source = self.model.config.get('source')
+        if source:
+            ch_fetch.add_source(
                 self.model.config['source'],
                 self.model.config.get('key'))
-        apt_update(fatal=True)
+        if self._prefetched(source):
+            # The package index was refreshed when the packages were
+            # prefetched, refreshing it again could select versions other
+            # than those already in the apt cache.
+            logging.info("Installing prefetched packages")
+        else:
+            apt_update(fatal=True)
         apt_install(self.PACKAGES, fatal=True)
+        self._stored.prefetched_source = None
+        self._stored.prefetched_time = None
+        logging.info("Installed packages: %s", self.package_versions())
         self.update_status()
 
+    def _prefetched(self, source):
+        """Whether packages were prefetched from source recently enough.
+
+        Prefetched packages expire after PREFETCH_MAX_AGE seconds, as the
+        package index they were selected from goes stale.
+
+        :param source: Value of the 'source' option.
+        :type source: Optional[str]
+        :rtype: bool
+        """
+        if self._stored.prefetched_source != (source or ''):
+            return False
+        age = time.time() - (self._stored.prefetched_time or 0)
+        if age > self.PREFETCH_MAX_AGE:
+            logging.info(
+                "Packages were prefetched %.0fs ago, updating the package "
+                "index", age)
+            return False
+        return True
+
+    def package_versions(self):
+        """Get the installed version of each of PACKAGES.
+
+        :returns: Version of each package, None if it is not installed.
+        :rtype: Dict[str, Optional[str]]
+        """
+        return dpkg.installed_versions(self.PACKAGES)
+
+    def update_workload_version(self):
+        """Set the workload version from the installed package version.
+
+        Does nothing unless VERSION_PACKAGE is set. The version is only set
+        when it changes.
+        """
+        package = self.VERSION_PACKAGE
+        if not package:
+            return
+        version = dpkg.installed_versions([package])[package]
+        if version is None:
+            return
+        version = dpkg.upstream_version(version)
+        if version != self._stored.workload_version:
+            self.unit.set_workload_version(version)
+            self._stored.workload_version = version
+
+    def prefetch_pkgs(self):
+        """Download PACKAGES into the apt cache without installing them.
+
+        Services keep running while the packages are downloaded. A subsequent
+        install_pkgs() then only has to unpack them from the local cache.
+
+        :returns: Size in bytes of the packages downloaded.
+        :rtype: int
+        """
+        logging.info("Prefetching packages")
+        source = self.model.config.get('source')
+        if source:
+            ch_fetch.add_source(
+                self.model.config['source'],
+                self.model.config.get('key'))
+        apt_update(fatal=True)
+        cache_size = _apt_archive_size()
+        apt_install(self.PACKAGES, options=['--download-only'], fatal=True)
+        self._stored.prefetched_source = source or ''
+        self._stored.prefetched_time = time.time()
+        downloaded = _apt_archive_size() - cache_size
+        logging.info("Prefetched %d bytes of packages", downloaded)
+        return downloaded
+
     def on_install(self, event):
         self.install_pkgs()
 
     def custom_status_check(self):
         raise NotImplementedError
 
-    def register_status_check(self, custom_check):
+    def shared_value(self, key, compute, inputs):
+        """Return an application-wide value computed once by the leader.
+
+        If PEER_RELATION is set, the leader publishes the value it computes
+        in the peer relation's application data, along with a digest of the
+        inputs it was computed from. Other units use the published value if
+        it was computed from the same inputs, and compute it themselves
+        otherwise, for instance before the leader has seen a config change.
+
+        :param key: Name of the value.
+        :type key: str
+        :param compute: Function computing the value, which must be
+                        serializable to JSON.
+        :type compute: Callable[[], any]
+        :param inputs: Everything the value depends on, e.g. the config.
+        :type inputs: Mapping[str, any]
+        :returns: The value, as it was serialized if it was published.
+        """
+        digest = config_digest(inputs)
+        if (key, digest) in self._shared:
+            return self._shared[(key, digest)]
+        relation = (self.model.get_relation(self.PEER_RELATION)
+                    if self.PEER_RELATION else None)
+        if relation is None:
+            value = compute()
+        else:
+            data = relation.data[self.app]
+            field = 'shared-{}'.format(key)
+            try:
+                published = json.loads(data.get(field) or '{}')
+            except ValueError:
+                published = {}
+            if published.get('digest') == digest:
+                value = published['value']
+            else:
+                value = compute()
+                if self.unit.is_leader() and not self._planning:
+                    data[field] = json.dumps(
+                        {'digest': digest, 'value': value}, sort_keys=True)
+                else:
+                    logger.debug("Computed %s, leader's value is stale", key)
+        self._shared[(key, digest)] = value
+        return value
+
+    def register_status_check(self, custom_check, cost=CHEAP_CHECK,
+                              interval=0):
+        """Register a check to be run when calculating the unit's status.
+
+        Cheap checks run on every status update. Expensive checks only run
+        once interval seconds have passed since they last ran, if their last
+        result was not active or if the machine is idle, otherwise their last
+        result is reused.
+
+        :param custom_check: Function returning a StatusBase.
+        :type custom_check: Callable[[], StatusBase]
+        :param cost: CHEAP_CHECK or EXPENSIVE_CHECK
+        :type cost: str
+        :param interval: Minimum seconds between runs of an expensive check.
+        :type interval: float
+        """
         self.custom_status_checks.append(custom_check)
+        self._status_check_schedule[custom_check] = (cost, interval)
+
+    @staticmethod
+    def _check_name(check):
+        return getattr(check, '__name__', str(check))
+
+    def _machine_idle(self):
+        try:
+            load = os.getloadavg()[0]
+        except OSError:
+            return False
+        return load / (os.cpu_count() or 1) < self.IDLE_LOAD
+
+    def _status_check_due(self, check, now):
+        """Whether a status check should run or reuse its last result.
+
+        :param check: Registered status check.
+        :type check: Callable[[], StatusBase]
+        :param now: Current time.
+        :type now: float
+        :rtype: bool
+        """
+        cost, interval = self._status_check_schedule.get(
+            check, (CHEAP_CHECK, 0))
+        if cost == CHEAP_CHECK:
+            return True
+        last = self._stored.status_check_results.get(self._check_name(check))
+        if last is None or last['status'] != ActiveStatus.name:
+            return True
+        remaining = self.remaining_budget()
+        if last.get('duration', 0) > remaining:
+            logger.warning(
+                "Deferring status check %s, it took %.1fs last time with "
+                "%.1fs of the hook budget left",
+                self._check_name(check), last['duration'], remaining)
+            return False
+        if now - last['time'] >= interval:
+            return True
+        return self._machine_idle()
+
+    def remaining_budget(self):
+        """Seconds left of the hook's HOOK_BUDGET, negative once overrun.
+
+        :rtype: float
+        """
+        return self._hook_start + self.HOOK_BUDGET - time.time()
+
+    def _check_overrun(self, name):
+        overrun = -self.remaining_budget()
+        if overrun > 0:
+            logger.warning(
+                "Hook %s is %.1fs over its %ds budget after %s",
+                os.environ.get('JUJU_HOOK_NAME') or
+                os.environ.get('JUJU_ACTION_NAME'),
+                overrun, self.HOOK_BUDGET, name)
+
+    def register_work(self, name, func, critical=False, estimate=None):
+        """Register a unit of work to be run with run_work().
+
+        Example::
+
+        class MyCharm(OSBaseCharm):
+
+            def __init__(self, framework):
+                super().__init__(framework)
+                self.register_work('rebuild-index', self.rebuild_index)
+
+            def on_config(self, event):
+                ...
+                self.run_work('rebuild-index')
+
+        :param name: Name of the work, used to persist it when deferred.
+        :type name: str
+        :param func: Function doing the work.
+        :type func: Callable[[], None]
+        :param critical: Whether the work must run even if it overruns the
+                         hook budget.
+        :type critical: bool
+        :param estimate: Seconds the work is expected to take, defaults to
+                         how long it took last time.
+        :type estimate: Optional[float]
+        """
+        self._work[name] = (func, critical, estimate)
+
+    def run_work(self, name):
+        """Run registered work within the hook's time budget.
+
+        Work that is not critical and is not expected to fit in the
+        remaining budget is deferred. The names of deferred work are kept in
+        stored state, and the work is run again when the next hook
+        completes, before its stored state is committed. Deferred work that
+        fails is run again up to WORK_RETRIES times, and deferred work
+        expected to take longer than the whole HOOK_BUDGET is run in the
+        next of FAST_DISPATCH_HOOKS, which have little else to do. Work
+        running past the budget is logged as an overrun.
+
+        :param name: Name the work was registered with.
+        :type name: str
+        :returns: Whether the work ran.
+        :rtype: bool
+        :raises: Exception raised by the work.
+        """
+        return self._run_work(name, force=False)
+
+    def _expected_duration(self, name):
+        _, _, estimate = self._work[name]
+        if estimate is None:
+            return self._stored.work_durations.get(name, 0)
+        return estimate
+
+    def _run_work(self, name, force):
+        func, critical, _ = self._work[name]
+        deferred = self._stored.deferred_work
+        if not critical and not force:
+            expected = self._expected_duration(name)
+            remaining = self.remaining_budget()
+            if expected > remaining:
+                logger.warning(
+                    "Deferring %s, expected to take %.1fs with %.1fs of the "
+                    "hook budget left", name, expected, remaining)
+                if name not in deferred:
+                    deferred.append(name)
+                return False
+        start = time.time()
+        try:
+            func()
+        finally:
+            self._stored.work_durations[name] = time.time() - start
+            self._check_overrun(name)
+        if name in deferred:
+            deferred.remove(name)
+        return True
+
+    def _run_deferred_work(self):
+        # Charms may commit the framework themselves, deferred work is run at
+        # the first commit.
+        if self._deferred_work_run:
+            return
+        self._deferred_work_run = True
+        failures = self._stored.work_failures
+        for name in list(self._stored.deferred_work):
+            if name not in self._work:
+                continue
+            force = (self.fast_dispatch and
+                     self._expected_duration(name) > self.HOOK_BUDGET)
+            try:
+                ran = self._run_work(name, force=force)
+            except Exception:
+                failures[name] = failures.get(name, 0) + 1
+                if failures[name] > self.WORK_RETRIES:
+                    logger.exception(
+                        "Dropping deferred %s, failed %d times",
+                        name, failures[name])
+                    self._stored.deferred_work.remove(name)
+                    del failures[name]
+                else:
+                    logger.exception(
+                        "Deferred %s failed, it will be run again", name)
+                continue
+            if ran:
+                failures.pop(name, None)
+
+    def register_latency_probe(self, name, probe, threshold=None,
+                               threshold_option=None, samples=20):
+        """Register a status check measuring the latency of the payload.
+
+        The probe is run several times each time the status is updated,
+        once the charm is started and its services are running. If it fails
+        the unit is blocked, and if the 95th percentile of its latency is
+        above the threshold the unit's active status message reports it as
+        degraded.
+
+        Example::
+
+        class MyCharm(OSBaseCharm):
+
+            def __init__(self, framework):
+                super().__init__(framework)
+                self.register_latency_probe(
+                    'api',
+                    ops_openstack.probes.http_head('http://localhost:8776/'),
+                    threshold=500,
+                    threshold_option='api-latency-threshold')
+
+        :param name: Name of the probe used in status messages.
+        :type name: str
+        :param probe: Function raising an exception if the probe fails, see
+                      ops_openstack.probes.
+        :type probe: Callable[[], None]
+        :param threshold: Latency threshold in milliseconds.
+        :type threshold: Optional[float]
+        :param threshold_option: Config option overriding the threshold.
+        :type threshold_option: Optional[str]
+        :param samples: Number of times to run the probe per check.
+        :type samples: int
+        """
+        if threshold_option:
+            threshold = probes.config_threshold(
+                self, threshold_option, threshold)
+        self._latency_probes.append(
+            probes.LatencyProbe(
+                name, probe, samples=samples, threshold=threshold))
 
     def update_status(self):
         """Update the charms status
@@ -132,7 +673,10 @@ class OSBaseCharm(CharmBase):
         anything else then the charms status is set to the object the check
         returned and no subsequent checks are run. If the check returns an
         ActiveStatus with a specific message then this message will be
-        concatenated with the other active status messages.
+        concatenated with the other active status messages. A check can be a
+        coroutine function, see ops_openstack.aio, in which case it is run
+        concurrently with the other coroutine checks before the checks'
+        results are considered in order.
 
         Example::
 
@@ -151,9 +695,80 @@ class OSBaseCharm(CharmBase):
 
         """
         logging.info("Updating status")
+        start = time.time()
+        timings = []
+        self._update_status(timings)
+        self._record_history(
+            EVALUATION, start,
+            status=self.unit.status.name,
+            checks=timings)
+        self.update_workload_version()
+
+    def _run_async_status_checks(self, due):
+        """Run the coroutine status checks concurrently.
+
+        Checks are given up on once the hook budget runs out, but calls they
+        started in the ops_openstack.aio thread pool still complete before
+        the hook exits.
+
+        :param due: Status checks to run.
+        :type due: List[Callable]
+        :returns: Result and duration of each coroutine check.
+        :rtype: Dict[Callable, Tuple[StatusBase, float]]
+        """
+        checks = [
+            check for check in due
+            if inspect.iscoroutinefunction(check)]
+        if not checks:
+            return {}
+
+        async def _timed(check):
+            start = time.time()
+            result = await check()
+            return result, time.time() - start
+
+        start = time.time()
+        try:
+            results = aio.run(
+                aio.gather(*[_timed(check) for check in checks]),
+                deadline=time.monotonic() + max(self.remaining_budget(), 0))
+        except asyncio.TimeoutError:
+            names = ', '.join(self._check_name(check) for check in checks)
+            logger.warning(
+                "Status checks %s did not complete within the hook budget",
+                names)
+            status = WaitingStatus('Status checks timed out: {}'.format(names))
+            results = [(status, time.time() - start)] * len(checks)
+        return dict(zip(checks, results))
+
+    def _update_status(self, timings):
         active_messages = ['Unit is ready']
+        now = time.time()
+        due = [
+            check for check in self.custom_status_checks
+            if self._status_check_due(check, now)]
+        async_results = self._run_async_status_checks(due)
+        results = self._stored.status_check_results
         for check in self.custom_status_checks:
-            _result = check()
+            name = self._check_name(check)
+            if check not in due:
+                last = results[name]
+                _result = StatusBase.from_name(last['status'], last['message'])
+                logging.debug("Reusing result of status check %s", name)
+            else:
+                if check in async_results:
+                    _result, duration = async_results[check]
+                else:
+                    check_start = time.time()
+                    _result = check()
+                    duration = time.time() - check_start
+                timings.append((name, duration))
+                self._check_overrun(name)
+                results[name] = {
+                    'time': now,
+                    'duration': duration,
+                    'status': _result.name,
+                    'message': _result.message}
             if isinstance(_result, ActiveStatus):
                 if _result.message:
                     active_messages.append(_result.message)
@@ -181,13 +796,28 @@ class OSBaseCharm(CharmBase):
                 'Missing relations: {}'.format(', '.join(missing_relations)))
             return
 
+        check_start = time.time()
         _, services_not_running_msg = os_utils.ows_check_services_running(
             self.services(), ports=[])
+        timings.append(('services', time.time() - check_start))
+        self._check_overrun('services')
         if services_not_running_msg is not None:
             self.unit.status = BlockedStatus(services_not_running_msg)
             return
 
         if self._stored.is_started:
+            # Probes would fail while the services are stopped or not yet
+            # configured, so they only run once the checks above pass.
+            for probe in self._latency_probes:
+                check_start = time.time()
+                _result = probe()
+                timings.append((probe.__name__, time.time() - check_start))
+                self._check_overrun(probe.__name__)
+                if not isinstance(_result, ActiveStatus):
+                    self.unit.status = _result
+                    return
+                if _result.message:
+                    active_messages.append(_result.message)
             _unique = []
             # Reverse sort the list so that a shorter message that has the same
             # start as a longer message comes first and can then be omitted.
@@ -206,26 +836,117 @@ class OSBaseCharm(CharmBase):
     def on_update_status(self, event):
         self.update_status()
 
+    @property
+    def status_history(self):
+        """History of status evaluations and hook durations.
+
+        :rtype: ops_openstack.history.StatusHistory
+        """
+        return StatusHistory(self.charm_dir / '.status-history')
+
+    def _record_history(self, kind, start, **kwargs):
+        try:
+            self.status_history.append(
+                kind, start, time.time() - start, **kwargs)
+        except OSError as e:
+            logger.debug("Unable to record status history: %s", e)
+
+    def on_status_history_action(self, event):
+        event.set_results({
+            'summary': json.dumps(
+                self.status_history.summary(), indent=2, sort_keys=True)})
+
     def services(self):
         _svcs = []
         for svc in self.RESTART_MAP.values():
             _svcs.extend(svc)
         return list(set(_svcs))
 
+    def _run_series_upgrade_stage(self, stage):
+        """Run a series upgrade stage against each service.
+
+        The services are paused or resumed in parallel. Each service is
+        checkpointed in StoredState, and the state committed, as soon as its
+        action completes so that if the hook fails and is retried only the
+        services that were not handled yet are acted upon.
+
+        :param stage: Action to run against the services, 'pause' or 'resume'
+        :type stage: str
+        :raises: Exception raised by the first failed service action, or
+                 RuntimeError if the action was unsuccessful for any service.
+        """
+        checkpoints = self._stored.series_upgrade_checkpoints
+        done = set(checkpoints.get(stage, []))
+        pending = [svc for svc in self.services() if svc not in done]
+        error = None
+        failed = []
+        start = time.time()
+        with futures.ThreadPoolExecutor(
+                max_workers=self.SERIES_UPGRADE_WORKERS) as executor:
+            jobs = {
+                executor.submit(
+                    os_utils.manage_payload_services,
+                    stage,
+                    services=[svc],
+                    charm_func=None): svc
+                for svc in pending}
+            for job in futures.as_completed(jobs):
+                svc = jobs[job]
+                try:
+                    success, messages = job.result()
+                except Exception as e:
+                    logger.error("Failed to %s %s: %s", stage, svc, e)
+                    error = error or e
+                    continue
+                if not success:
+                    logger.error(
+                        "Failed to %s %s: %s", stage, svc,
+                        ', '.join(messages or []))
+                    failed.append(svc)
+                    continue
+                done.add(svc)
+                checkpoints[stage] = sorted(done)
+                self._checkpoint()
+        elapsed = time.time() - start
+        self._stored.series_upgrade_timings[stage] = elapsed
+        logger.info(
+            "Series upgrade stage %s took %.2fs for %d service(s)",
+            stage, elapsed, len(pending))
+        if error:
+            raise error
+        if failed:
+            # The hook fails, to be retried for the services left pending.
+            raise RuntimeError('Failed to {} {}'.format(
+                stage, ', '.join(sorted(failed))))
+
+    def _checkpoint(self):
+        """Commit stored state part way through a hook.
+
+        The end of hook bookkeeping observing the framework's commit event,
+        e.g. profiling and status history, is skipped.
+        """
+        self._checkpointing = True
+        try:
+            self.framework.commit()
+        finally:
+            self._checkpointing = False
+
+    def on_prefetch_packages_action(self, event):
+        downloaded = self.prefetch_pkgs()
+        event.set_results({
+            'packages': ' '.join(self.PACKAGES),
+            'downloaded-bytes': downloaded,
+            'cache-bytes': _apt_archive_size()})
+
     def on_pre_series_upgrade(self, event):
-        _, messages = os_utils.manage_payload_services(
-            'pause',
-            services=self.services(),
-            charm_func=None)
-        self._stored.is_paused = True
         self._stored.series_upgrade = True
+        self._run_series_upgrade_stage('pause')
+        self._stored.is_paused = True
         self.update_status()
 
     def on_post_series_upgrade(self, event):
-        _, messages = os_utils.manage_payload_services(
-            'resume',
-            services=self.services(),
-            charm_func=None)
+        self._run_series_upgrade_stage('resume')
+        self._stored.series_upgrade_checkpoints = {}
         self._stored.is_paused = False
         self._stored.series_upgrade = False
         self.update_status()
@@ -247,20 +968,388 @@ class OSBaseCharm(CharmBase):
         self.update_status()
 
     def on_config(self, event):
-        """Main entry point for configuration changes."""
+        """Main entry point for configuration changes.
+
+        self.config_delta holds the options which changed since the config
+        was last applied. If the event is deferred the config is not
+        recorded as applied, and config observers are not run.
+        """
         pass
 
+    def register_config_observer(self, keys, callback):
+        """Register a callback to run when any of the given options change.
+
+        Callbacks are run after on_config() and are passed the
+        ops_openstack.config.ConfigDelta describing the change.
+
+        Example::
+
+        class MyCharm(OSBaseCharm):
+
+            def __init__(self, framework):
+                super().__init__(framework)
+                self.register_config_observer(
+                    ['debug', 'verbose'], self.render_logging)
+
+            def render_logging(self, delta):
+                ...
+
+        :param keys: Option name, or names, to observe.
+        :type keys: Union[str, Iterable[str]]
+        :param callback: Function to call with the delta.
+        :type callback: Callable[[ConfigDelta], None]
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        self._config_observers.append((frozenset(keys), callback))
+
+    def _on_pre_commit(self, event):
+        # Stored state is saved when the commit event is emitted, changes
+        # made by the deferred work must be made before.
+        if self._checkpointing:
+            return
+        self._run_deferred_work()
+
+    def _on_commit(self, event):
+        if self._checkpointing:
+            return
+        self._stop_profiling()
+        self._stop_recording()
+        self._stop_memory_report()
+        hook = (os.environ.get('JUJU_HOOK_NAME') or
+                os.environ.get('JUJU_ACTION_NAME'))
+        if hook:
+            self._record_history(HOOK, self._hook_start, name=hook)
+
+    @property
+    def profile_dir(self):
+        """Directory hook profiles are written to, see PROFILE_ROOTS.
+
+        :rtype: pathlib.Path
+        """
+        root = next(
+            (r for r in PROFILE_ROOTS if os.path.isdir(r)), PROFILE_ROOTS[-1])
+        return (pathlib.Path(root) / 'ops-openstack-profiles' /
+                self.unit.name.replace('/', '-'))
+
+    def _selected_hooks(self, option):
+        """Names of the hooks selected for profiling or recording.
+
+        Hooks are selected with a comma separated list of hook names, or
+        'all', in the config option if the charm has one, or else in a file
+        of the same name prefixed with a '.' in the charm directory. An empty
+        file selects all hooks. The selection is looked up once per hook.
+
+        :param option: 'profile-hooks', 'record-hooks' or
+                       'memory-report-hooks'
+        :type option: str
+        :rtype: Set[str]
+        """
+        if option not in self._hook_selection:
+            # Reading the config runs config-get, skip it for charms without
+            # the option.
+            selected = (self.model.config.get(option)
+                        if option in self.meta.config else None)
+            marker = self.charm_dir / '.{}'.format(option)
+            if not selected and marker.exists():
+                selected = marker.read_text().strip() or 'all'
+            self._hook_selection[option] = set(
+                hook.strip() for hook in (selected or '').split(',')
+                if hook.strip())
+        return self._hook_selection[option]
+
+    def _start_profiling(self):
+        hook = os.environ.get('JUJU_HOOK_NAME')
+        if not hook:
+            return
+        hooks = self._selected_hooks('profile-hooks')
+        if hook in hooks or 'all' in hooks:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _stop_profiling(self):
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        path = self.profile_dir / '{}-{:.0f}.pstats'.format(
+            os.environ.get('JUJU_HOOK_NAME'), time.time() * 1000)
+        self._profiler.dump_stats(str(path))
+        self._profiler = None
+        logger.info("Hook profile written to %s", path)
+        profiles = sorted(
+            self.profile_dir.glob('*.pstats'),
+            key=lambda p: p.stat().st_mtime)
+        for profile in profiles[:-self.PROFILE_KEEP]:
+            profile.unlink()
+
+    def _start_memory_report(self):
+        """Trace memory allocations if the hook is selected for it.
+
+        Hooks and actions are selected with the 'memory-report-hooks' config
+        option or '.memory-report-hooks' file, see _selected_hooks(). The
+        peak traced memory and the top allocation sites are logged when the
+        hook completes.
+        """
+        hook = (os.environ.get('JUJU_HOOK_NAME') or
+                os.environ.get('JUJU_ACTION_NAME'))
+        if not hook or tracemalloc.is_tracing():
+            return
+        hooks = self._selected_hooks('memory-report-hooks')
+        if hook in hooks or 'all' in hooks:
+            tracemalloc.start()
+            self._tracing_memory = True
+
+    def _stop_memory_report(self):
+        if not self._tracing_memory:
+            return
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self._tracing_memory = False
+        logger.info(
+            "Hook %s memory: %.1f KiB peak, %.1f KiB allocated",
+            os.environ.get('JUJU_HOOK_NAME') or
+            os.environ.get('JUJU_ACTION_NAME'),
+            peak / 1024, current / 1024)
+        for stat in snapshot.statistics('lineno')[:self.MEMORY_REPORT_TOP]:
+            logger.info("  %s", stat)
+
+    @property
+    def template_cache_dir(self):
+        """Directory compiled templates are cached in.
+
+        :rtype: pathlib.Path
+        """
+        return self.charm_dir / '.template-cache'
+
+    def render_template(self, source, target, context, perms=0o444):
+        """Render a template from the charm's templates directory.
+
+        Compiled templates are cached in template_cache_dir, so a template
+        is only compiled again once its contents change.
+
+        :param source: Template name, relative to the templates directory.
+        :type source: str
+        :param target: File to write.
+        :type target: str
+        :param context: Template context, e.g. OpenStackRelationAdapters or
+                        the result of its to_context().
+        :type context: Union[Mapping[str, any], Iterable[Tuple[str, any]]]
+        :param perms: Mode of the file.
+        :type perms: int
+        :returns: Whether the file was written.
+        :rtype: bool
+        """
+        return templating.render(
+            source, target, context,
+            templates_dir=str(self.charm_dir / 'templates'),
+            cache_dir=str(self.template_cache_dir),
+            perms=perms)
+
+    @property
+    def trace_dir(self):
+        """Directory hook traces are written to.
+
+        :rtype: pathlib.Path
+        """
+        return self.charm_dir / '.traces'
+
+    def _start_recording(self):
+        """Record the inputs of the hook if it is selected for recording.
+
+        Hooks and actions are selected with the 'record-hooks' config option
+        or '.record-hooks' file, see _selected_hooks(). Traces can be replayed
+        with ops_openstack.trace.replay().
+        """
+        hook = (os.environ.get('JUJU_HOOK_NAME') or
+                os.environ.get('JUJU_ACTION_NAME'))
+        if not hook:
+            return
+        hooks = self._selected_hooks('record-hooks')
+        if hook not in hooks and 'all' not in hooks:
+            return
+        self._trace = trace.snapshot(self)
+        self._trace['stored'] = trace.stored_snapshot(
+            self._stored, self._stored_names)
+        if os.environ.get('JUJU_ACTION_NAME'):
+            self._trace['action_params'] = hookenv.action_get()
+        self._recorder = trace.Recorder()
+        self._recorder.start()
+
+    def _stop_recording(self):
+        if self._recorder is None:
+            return
+        self._recorder.stop()
+        self._trace['calls'] = self._recorder.calls
+        self._trace['duration'] = time.time() - self._hook_start
+        hook = (os.environ.get('JUJU_HOOK_NAME') or
+                os.environ.get('JUJU_ACTION_NAME'))
+        try:
+            self.trace_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            path = self.trace_dir / '{}-{:.0f}.trace'.format(
+                hook, time.time() * 1000)
+            trace.write(path, self._trace)
+            traces = sorted(
+                self.trace_dir.glob('*.trace'),
+                key=lambda p: p.stat().st_mtime)
+            for old in traces[:-self.TRACE_KEEP]:
+                old.unlink()
+        except OSError as e:
+            logger.warning("Unable to write hook trace: %s", e)
+        else:
+            logger.info("Hook trace written to %s", path)
+        self._recorder = None
+        self._trace = None
+
+    def on_profile_report_action(self, event):
+        hook = event.params.get('hook')
+        profiles = sorted(
+            self.profile_dir.glob('{}-*.pstats'.format(hook or '*')),
+            key=lambda p: p.stat().st_mtime)
+        if not profiles:
+            event.fail('No hook profiles found')
+            return
+        report = io.StringIO()
+        stats = pstats.Stats(str(profiles[-1]), stream=report)
+        stats.sort_stats('cumulative').print_stats(
+            int(event.params.get('count', 20)))
+        event.set_results({
+            'profile': str(profiles[-1]),
+            'report': report.getvalue()})
+
+    def _on_upgrade_charm(self, event):
+        # The new charm code may render config differently, so treat all of
+        # the config as new on the next config-changed.
+        self._stored.applied_config = None
+
+    def validate_config(self, config=None):
+        """Validate the charm config against the charm's config schema.
+
+        The schema is made up of CONFIG_SCHEMA, MANDATORY_CONFIG and
+        CONFIG_RULES and is compiled on first use. The result is cached
+        against a digest of the config for the rest of the hook only, so
+        that in config-changed the status update reuses the validation of
+        the config being applied. It is not kept between hooks, as the
+        coerced values cannot be held in stored state and the rules may
+        change with the charm.
+
+        :param config: Config to validate, defaults to the charm config.
+        :type config: Optional[Mapping[str, any]]
+        :returns: Result of the validation
+        :rtype: ops_openstack.config.ConfigValidationResult
+        """
+        if config is None:
+            config = self.framework.model.config
+        digest = config_digest(config)
+        if self._config_validation and self._config_validation[0] == digest:
+            return self._config_validation[1]
+        if self._config_validator is None:
+            self._config_validator = ConfigValidator(
+                schema=self.CONFIG_SCHEMA,
+                mandatory=self.MANDATORY_CONFIG,
+                rules=self.CONFIG_RULES)
+        result = self._config_validator.validate(config)
+        self._config_validation = (digest, result)
+        return result
+
+    def check_config(self):
+        result = self.validate_config()
+        if result:
+            return ActiveStatus()
+        return BlockedStatus(result.message)
+
+    def plan_config(self, proposed):
+        """Report what applying config changes would do, without doing it.
+
+        Example::
+
+        charm.plan_config({'debug': True})
+        {'changed': ['debug'],
+         'valid': True,
+         'message': '',
+         'files': ['/etc/cinder/cinder.conf'],
+         'services': ['cinder-volume']}
+
+        :param proposed: Options to change and their new values.
+        :type proposed: Mapping[str, any]
+        :returns: Impact report, see config_impact().
+        :rtype: Dict[str, any]
+        """
+        current = dict(self.framework.model.config)
+        config = dict(current)
+        config.update(proposed)
+        delta = ConfigDelta(current, config)
+        result = self.validate_config(config)
+        self._planning = True
+        try:
+            impact = self.config_impact(delta, config)
+        finally:
+            self._planning = False
+        impact.update({
+            'changed': sorted(delta.keys),
+            'valid': bool(result),
+            'message': '' if result else result.message})
+        return impact
+
+    def config_impact(self, delta, config):
+        """Describe the effects of a config change.
+
+        Charms extend the report with the effects of their on_config(), for
+        instance relation data they would write. This must not change
+        anything: leader values are not published by shared_value() while
+        planning.
+
+        :param delta: Options that would change.
+        :type delta: ops_openstack.config.ConfigDelta
+        :param config: Config that would be applied.
+        :type config: Dict[str, any]
+        :returns: Files in RESTART_MAP that would be rewritten ('files') and
+                  services that would be restarted ('services').
+        :rtype: Dict[str, any]
+        """
+        files = sorted(
+            path for path in self.RESTART_MAP
+            if delta and delta.affects(
+                self.CONFIG_FILE_OPTIONS.get(path, delta.keys)))
+        services = set()
+        for path in files:
+            services.update(self.RESTART_MAP[path])
+        return {'files': files, 'services': sorted(services)}
+
+    def on_plan_config_action(self, event):
+        try:
+            proposed = json.loads(event.params.get('config') or '{}')
+        except ValueError as e:
+            event.fail('Invalid config: {}'.format(e))
+            return
+        if not isinstance(proposed, dict):
+            event.fail('Invalid config: expected a JSON object')
+            return
+        event.set_results({
+            'plan': json.dumps(
+                self.plan_config(proposed), indent=2, sort_keys=True)})
+
     def _on_config(self, event):
-        missing = []
-        config = self.framework.model.config
-        for param in self.MANDATORY_CONFIG:
-            if param not in config:
-                missing.append(param)
-        if missing:
-            self.unit.status = BlockedStatus(
-                'Missing option(s): ' + ','.join(missing))
+        result = self.validate_config()
+        if not result:
+            self.unit.status = BlockedStatus(result.message)
             return
+        config = dict(self.framework.model.config)
+        previous = self._stored.applied_config
+        self.config_delta = ConfigDelta(
+            None if previous is None else dict(previous),
+            config)
+        logger.debug("Config delta: %s", self.config_delta)
         self.on_config(event)
+        if event.deferred:
+            # The config is applied when the event is emitted again, with the
+            # same delta.
+            return
+        for keys, callback in self._config_observers:
+            if self.config_delta.affects(keys):
+                callback(self.config_delta)
+        self._stored.applied_config = config
 
 
 def charm_class(cls):
@@ -273,9 +1362,14 @@ def get_charm_class(release=None, package_type='deb', all_releases=None,
     """Get an instance of the charm based on the release (or use the
     default if release is None).
 
-    OS releases are in alphabetical order, so it looks for the first release
-    that is provided if release is None, otherwise it finds the release that is
-    before or equal to the release passed.
+    Releases are ordered by their position in all_releases if it is passed,
+    otherwise by their ordinal in ops_openstack.releases. It looks for the
+    latest release that is provided if release is None, otherwise it finds
+    the release that is before or equal to the release passed.
+
+    Classes can be registered for either OpenStack or Ceph releases. When
+    they are registered for Ceph releases and an OpenStack release is passed
+    it is mapped to the Ceph release shipped with it.
 
     Note that it passes args and kwargs to the class __init__() method.
 
@@ -283,33 +1377,45 @@ def get_charm_class(release=None, package_type='deb', all_releases=None,
     :param package_type: string representing the package type required
     :returns: BaseOpenStackCharm() derived class according to cls.releases
     """
-    if not all_releases:
-        all_releases = os_utils.OPENSTACK_RELEASES
     if len(_releases.keys()) == 0:
         raise RuntimeError(
             "No derived BaseOpenStackCharm() classes registered")
-    # Note that this relies on OS releases being in alphabetical order
-    known_releases = sorted(_releases.keys())
+    if all_releases:
+        ordinals = {r: i for i, r in enumerate(all_releases)}
+    else:
+        tracks = set(releases.track(r) for r in _releases)
+        if len(tracks) != 1 or None in tracks:
+            raise RuntimeError(
+                "Charm classes must be registered for known releases of a "
+                "single track: {}".format(', '.join(sorted(_releases))))
+        track = tracks.pop()
+        ordinals = releases.ORDINALS[track]
+        if release is not None and release not in ordinals:
+            release = releases.to_track(release, track) or release
+    known_releases = sorted(
+        (r for r in _releases if r in ordinals), key=ordinals.get)
+    if not known_releases:
+        raise RuntimeError(
+            "No derived BaseOpenStackCharm() classes registered for known "
+            "releases")
     cls = None
     if release is None:
         # take the latest version of the charm if no release is passed.
         cls = _releases[known_releases[-1]][package_type]
     else:
         # check that the release is a valid release
-        if release not in all_releases:
+        if release not in ordinals:
             raise RuntimeError(
                 "Release {} is not a known OpenStack release?".format(release))
-        release_index = all_releases.index(release)
-        if (release_index <
-                all_releases.index(known_releases[0])):
+        release_ordinal = ordinals[release]
+        if release_ordinal < ordinals[known_releases[0]]:
             raise RuntimeError(
                 "Release {} is not supported by this charm. Earliest support "
                 "is {} release".format(release, known_releases[0]))
         else:
             # try to find the release that is supported.
             for known_release in reversed(known_releases):
-                if (release_index >=
-                        all_releases.index(known_release) and
+                if (release_ordinal >= ordinals[known_release] and
                         package_type in _releases[known_release]):
                     cls = _releases[known_release][package_type]
                     break
@@ -340,9 +1446,5 @@ def get_charm_class_for_release():
         _origin = config['openstack-origin']
     if not _origin:
         _origin = 'distro'
-    # XXX Make this support openstack and ceph
     target_release = os_utils.get_os_codename_install_source(_origin)
-    # Check for a cepch charm match first:
-    ceph_release = UCA_CODENAME_MAP[target_release]
-    releases = sorted(list(set(UCA_CODENAME_MAP.values())))
-    return get_charm_class(release=ceph_release, all_releases=releases)
+    return get_charm_class(release=target_release)
@@ -0,0 +1,103 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read installed package versions from the dpkg status file.
+
+Rather than running dpkg-query, the status file is mapped into memory and
+only the stanzas of the packages asked for are parsed. Results are cached
+until the file is replaced or modified, which dpkg does on every change.
+"""
+
+import mmap
+import os
+
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+_index = {}
+
+
+def _scan(path, packages):
+    """Find the installed version of packages in a dpkg status file.
+
+    :param path: dpkg status file
+    :type path: str
+    :param packages: Package names
+    :type packages: List[str]
+    :returns: Installed version of each package, None if not installed.
+    :rtype: Dict[str, Optional[str]]
+    """
+    versions = dict.fromkeys(packages)
+    with open(path, 'rb') as f:
+        try:
+            status = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return versions
+        with status:
+            for package in packages:
+                needle = b'Package: ' + package.encode('utf-8') + b'\n'
+                pos = 0 if status[:len(needle)] == needle else \
+                    status.find(b'\n' + needle)
+                # A package has one stanza per architecture it is known for.
+                while pos != -1:
+                    end = status.find(b'\n\n', pos + 1)
+                    fields = {}
+                    for line in status[pos:end if end != -1 else None].split(
+                            b'\n'):
+                        key, _, value = line.partition(b': ')
+                        fields[key] = value
+                    if fields.get(b'Status', b'').endswith(b' installed'):
+                        versions[package] = fields[b'Version'].decode('utf-8')
+                        break
+                    pos = status.find(b'\n' + needle, pos + 1)
+    return versions
+
+
+def installed_versions(packages, path=DPKG_STATUS):
+    """Get the installed version of packages.
+
+    :param packages: Package names
+    :type packages: List[str]
+    :param path: dpkg status file
+    :type path: str
+    :returns: Installed version of each package, None if not installed.
+    :rtype: Dict[str, Optional[str]]
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return dict.fromkeys(packages)
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if path not in _index or _index[path][0] != key:
+        _index[path] = (key, {})
+    versions = _index[path][1]
+    missing = [p for p in packages if p not in versions]
+    if missing:
+        versions.update(_scan(path, missing))
+    return {p: versions[p] for p in packages}
+
+
+def upstream_version(version):
+    """Strip the epoch and Debian revision from a package version.
+
+    :param version: Package version, e.g. '2:25.0.0-0ubuntu1'
+    :type version: str
+    :returns: Upstream version, e.g. '25.0.0'
+    :rtype: str
+    """
+    if ':' in version:
+        version = version.split(':', 1)[1]
+    if '-' in version:
+        version = version.rsplit('-', 1)[0]
+    return version
@@ -0,0 +1,204 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Machine-local coordination of apt operations.
+
+Principal and subordinate charms deployed to the same machine run their
+hooks concurrently and contend for the dpkg lock. apt_update() and
+apt_install() are drop-in replacements for the charmhelpers functions which
+serialise apt operations behind a file lock shared by all charms on the
+machine.
+
+Package requests are added to a queue file before waiting on the lock, and
+whichever charm gets the lock installs every pending request in a single
+transaction, so no request waits behind more than one transaction. Calls to
+apt_update() made within APT_UPDATE_WINDOW seconds of the previous update are
+skipped, unless the apt sources have changed since.
+"""
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+
+from ops_openstack.lazy import lazy_import
+
+ch_fetch = lazy_import('charmhelpers.fetch')
+
+LOCK_DIR = '/run/ops-openstack'
+APT_UPDATE_WINDOW = 60
+APT_SOURCES = [
+    '/etc/apt/sources.list',
+    '/etc/apt/sources.list.d',
+]
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def _lock(name):
+    """Hold an exclusive machine-wide lock.
+
+    :param name: Name of the lock file in LOCK_DIR
+    :type name: str
+    """
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    with open(os.path.join(LOCK_DIR, name), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_queue():
+    """Read the pending package requests, dropping those of dead processes.
+
+    Must be called with the 'apt-queue.lock' lock held.
+
+    :returns: Pending requests
+    :rtype: List[Dict[str, any]]
+    """
+    try:
+        with open(os.path.join(LOCK_DIR, 'apt.queue')) as queue_file:
+            queue = json.load(queue_file)
+    except (OSError, ValueError):
+        return []
+    return [entry for entry in queue if _pid_running(entry['pid'])]
+
+
+def _write_queue(queue):
+    """Replace the pending package requests.
+
+    Must be called with the 'apt-queue.lock' lock held.
+
+    :param queue: Pending requests
+    :type queue: List[Dict[str, any]]
+    """
+    path = os.path.join(LOCK_DIR, 'apt.queue')
+    with open(path + '.tmp', 'w') as queue_file:
+        json.dump(queue, queue_file)
+    os.rename(path + '.tmp', path)
+
+
+def _sources_mtime():
+    mtimes = [0]
+    for path in APT_SOURCES:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+            if os.path.isdir(path):
+                mtimes.extend(
+                    entry.stat().st_mtime for entry in os.scandir(path))
+        except OSError:
+            pass
+    return max(mtimes)
+
+
+def _batch_key(entry):
+    # Requests queued by older versions do not record 'fatal', they are only
+    # batched together.
+    return (entry['options'], entry.get('fatal'))
+
+
+def apt_update(fatal=False, window=None):
+    """Update the local apt cache unless it was updated recently.
+
+    :param fatal: Whether the command's output should be checked and
+                  retried.
+    :type fatal: bool
+    :param window: Seconds within which a previous update is reused,
+                   defaults to APT_UPDATE_WINDOW.
+    :type window: Optional[int]
+    """
+    if window is None:
+        window = APT_UPDATE_WINDOW
+    stamp = os.path.join(LOCK_DIR, 'apt-update.stamp')
+    with _lock('apt.lock'):
+        try:
+            updated = os.stat(stamp).st_mtime
+        except OSError:
+            updated = 0
+        if time.time() - updated < window and updated > _sources_mtime():
+            logger.debug("Skipping apt update, last run %.0fs ago",
+                         time.time() - updated)
+            return
+        ch_fetch.apt_update(fatal=fatal)
+        with open(stamp, 'w'):
+            pass
+
+
+def apt_install(packages, options=None, fatal=False):
+    """Install one or more packages.
+
+    Requests for packages with the same options and fatal flag pending from
+    other charms on the machine are installed in the same transaction. If the
+    request was already installed by another charm by the time the lock is
+    acquired this returns immediately.
+
+    :param packages: Package(s) to install
+    :type packages: Option[str, List[str]]
+    :param options: Options to pass on to apt-get
+    :type options: Option[None, List[str]]
+    :param fatal: Whether the command's output should be checked and
+                  retried.
+    :type fatal: bool
+    :raises: subprocess.CalledProcessError
+    """
+    if isinstance(packages, str):
+        packages = [packages]
+    request = {
+        'id': str(uuid.uuid4()),
+        'pid': os.getpid(),
+        'packages': list(packages),
+        'options': options,
+        'fatal': fatal}
+    with _lock('apt-queue.lock'):
+        _write_queue(_read_queue() + [request])
+    with _lock('apt.lock'):
+        with _lock('apt-queue.lock'):
+            queue = _read_queue()
+            if request['id'] not in [entry['id'] for entry in queue]:
+                logger.debug("Packages %s installed by another request",
+                             packages)
+                return
+            key = _batch_key(request)
+            batch = [e for e in queue if _batch_key(e) == key]
+            _write_queue([e for e in queue if _batch_key(e) != key])
+        merged = sorted(set(p for entry in batch for p in entry['packages']))
+        if len(batch) > 1:
+            logger.info("Installing %d merged package requests: %s",
+                        len(batch), merged)
+        try:
+            ch_fetch.apt_install(merged, options=options, fatal=fatal)
+        except Exception:
+            # Hand the other requests back to their owners so that they are
+            # not failed by a package they did not ask for.
+            with _lock('apt-queue.lock'):
+                _write_queue(
+                    [e for e in batch if e['id'] != request['id']] +
+                    _read_queue())
+            raise
@@ -0,0 +1,216 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded history of status evaluations and hook durations.
+
+The history is kept in a small binary file of fixed size records used as a
+ring buffer, so appending a record is a single seek and write and the file
+never grows beyond its capacity.
+"""
+
+import collections
+import math
+import struct
+
+MAGIC = b'OSH1'
+MAX_NAMES = 64
+NAME_SIZE = 48
+MAX_CHECKS = 16
+NO_NAME = 255
+
+STATUSES = ['unknown', 'active', 'blocked', 'maintenance', 'waiting', 'error']
+
+EVALUATION = 0
+HOOK = 1
+
+_HEADER = struct.Struct('<4sIII')
+_RECORD = struct.Struct('<dBBBfB' + 'Bf' * MAX_CHECKS)
+_NAMES_OFFSET = _HEADER.size
+_RECORDS_OFFSET = _NAMES_OFFSET + MAX_NAMES * NAME_SIZE
+
+
+def percentile(values, pct):
+    """Return the nearest-rank percentile of some values.
+
+    :param values: Values to take the percentile of.
+    :type values: List[float]
+    :param pct: Percentile, between 0 and 100.
+    :type pct: float
+    :rtype: Optional[float]
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(math.ceil(pct / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+class StatusHistory(object):
+    """Ring buffer of status evaluations and hook durations in a file."""
+
+    def __init__(self, path, capacity=256):
+        """
+        :param path: File the history is kept in.
+        :type path: str
+        :param capacity: Number of records kept, only used when the file is
+                         created.
+        :type capacity: int
+        """
+        self.path = str(path)
+        self.capacity = capacity
+
+    def _open(self):
+        try:
+            f = open(self.path, 'r+b')
+        except FileNotFoundError:
+            f = open(self.path, 'w+b')
+        header = f.read(_HEADER.size)
+        if len(header) == _HEADER.size and header[:4] == MAGIC:
+            _, capacity, position, count = _HEADER.unpack(header)
+            names = [
+                n.rstrip(b'\0').decode('utf-8')
+                for n in struct.unpack(
+                    '{}s'.format(NAME_SIZE) * MAX_NAMES,
+                    f.read(MAX_NAMES * NAME_SIZE))
+                if n.rstrip(b'\0')]
+        else:
+            capacity, position, count, names = self.capacity, 0, 0, []
+            f.seek(0)
+            f.truncate()
+            f.write(_HEADER.pack(MAGIC, capacity, position, count))
+            f.write(b'\0' * (MAX_NAMES * NAME_SIZE))
+        return f, capacity, position, count, names
+
+    def _name_index(self, f, names, name):
+        if name in names:
+            return names.index(name)
+        if len(names) >= MAX_NAMES:
+            return NO_NAME
+        names.append(name)
+        f.seek(_NAMES_OFFSET + (len(names) - 1) * NAME_SIZE)
+        f.write(name.encode('utf-8')[:NAME_SIZE].ljust(NAME_SIZE, b'\0'))
+        return len(names) - 1
+
+    def append(self, kind, timestamp, duration, status=None, name=None,
+               checks=None):
+        """Append a record, overwriting the oldest one if full.
+
+        :param kind: EVALUATION or HOOK
+        :type kind: int
+        :param timestamp: Time the evaluation or hook started.
+        :type timestamp: float
+        :param duration: Duration in seconds.
+        :type duration: float
+        :param status: Name of the resulting status, e.g. 'active'.
+        :type status: Optional[str]
+        :param name: Name of the hook.
+        :type name: Optional[str]
+        :param checks: Name and duration in seconds of each check run.
+        :type checks: Optional[List[Tuple[str, float]]]
+        """
+        f, capacity, position, count, names = self._open()
+        with f:
+            pairs = []
+            for check, check_duration in (checks or [])[:MAX_CHECKS]:
+                pairs.extend(
+                    [self._name_index(f, names, check), check_duration])
+            pairs.extend([NO_NAME, 0.0] * (MAX_CHECKS - len(pairs) // 2))
+            record = _RECORD.pack(
+                timestamp,
+                kind,
+                STATUSES.index(status) if status in STATUSES else 0,
+                NO_NAME if name is None else self._name_index(f, names, name),
+                duration,
+                min(len(checks or []), MAX_CHECKS),
+                *pairs)
+            f.seek(_RECORDS_OFFSET + position * _RECORD.size)
+            f.write(record)
+            f.seek(0)
+            f.write(_HEADER.pack(
+                MAGIC, capacity, (position + 1) % capacity,
+                min(count + 1, capacity)))
+
+    def records(self):
+        """Return the records held, oldest first.
+
+        :rtype: List[Dict[str, any]]
+        """
+        f, capacity, position, count, names = self._open()
+        with f:
+            first = (position - count) % capacity
+            f.seek(_RECORDS_OFFSET)
+            data = f.read(capacity * _RECORD.size)
+
+        def _name(index):
+            return names[index] if index < len(names) else None
+
+        records = []
+        for i in range(count):
+            offset = ((first + i) % capacity) * _RECORD.size
+            fields = _RECORD.unpack_from(data, offset)
+            timestamp, kind, status, name, duration, nchecks = fields[:6]
+            pairs = fields[6:6 + nchecks * 2]
+            records.append({
+                'kind': kind,
+                'timestamp': timestamp,
+                'duration': duration,
+                'status': STATUSES[status] if kind == EVALUATION else None,
+                'name': _name(name),
+                'checks': [
+                    (_name(pairs[j]), pairs[j + 1])
+                    for j in range(0, len(pairs), 2)]})
+        return records
+
+    def summary(self):
+        """Summarise the history.
+
+        Durations are reported in milliseconds as 50th, 95th and 99th
+        percentiles. Checks are ordered by their total duration, so those
+        that dominate the status evaluation come first.
+
+        :rtype: Dict[str, any]
+        """
+        def _pcts(values):
+            return {
+                'p{}'.format(pct): round(percentile(values, pct) * 1000, 1)
+                for pct in (50, 95, 99)}
+
+        evaluations = []
+        statuses = collections.Counter()
+        checks = collections.OrderedDict()
+        hooks = collections.OrderedDict()
+        for record in self.records():
+            if record['kind'] == HOOK:
+                hooks.setdefault(record['name'], []).append(
+                    record['duration'])
+                continue
+            evaluations.append(record['duration'])
+            statuses[record['status']] += 1
+            for check, duration in record['checks']:
+                checks.setdefault(check, []).append(duration)
+        summary = {
+            'evaluations': len(evaluations),
+            'statuses': dict(statuses),
+            'checks': [],
+            'hooks': {
+                hook: dict(_pcts(durations), count=len(durations))
+                for hook, durations in hooks.items()}}
+        if evaluations:
+            summary['duration'] = _pcts(evaluations)
+        for check, durations in sorted(
+                checks.items(), key=lambda c: sum(c[1]), reverse=True):
+            summary['checks'].append(
+                dict(_pcts(durations), name=check,
+                     total=round(sum(durations) * 1000, 1)))
+        return summary
@@ -0,0 +1,54 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hook context scoped cache of is-leader.
+
+charmhelpers.core.hookenv.is_leader() runs the is-leader hook tool on every
+call. Leadership cannot be lost within a Juju hook context, so the result is
+cached here until JUJU_CONTEXT_ID changes.
+"""
+
+import os
+
+import charmhelpers.core.hookenv as hookenv
+
+_cache = {}
+_context = None
+
+
+def _check_context():
+    global _context
+    context = os.environ.get('JUJU_CONTEXT_ID')
+    if context != _context:
+        reset()
+        _context = context
+
+
+def reset():
+    """Drop the cached is-leader result."""
+    _cache.clear()
+
+
+def is_leader():
+    """Whether this unit is the leader, see hookenv.is_leader().
+
+    The result is only cached within a Juju hook context, leadership may
+    change between calls made outside of one.
+    """
+    _check_context()
+    if _context is None:
+        return hookenv.is_leader()
+    if 'is-leader' not in _cache:
+        _cache['is-leader'] = hookenv.is_leader()
+    return _cache['is-leader']
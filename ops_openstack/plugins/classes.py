@@ -15,33 +15,83 @@
 import json
 
 import ops_openstack.core
-from charmhelpers.fetch import (
+from ops_openstack.config import config_digest
+from ops_openstack.relations import RelationDataBatch
+from ops_openstack.fetch import (
     apt_install,
     apt_update,
-    add_source
 )
-# ch_context needed for bluestore validation
-import charmhelpers.contrib.openstack.context as ch_context
+from ops_openstack.lazy import lazy_import
 from ops.model import (
     ActiveStatus,
     BlockedStatus,
 )
 
+# ch_context needed for bluestore validation, only loaded when it is done.
+ch_context = lazy_import('charmhelpers.contrib.openstack.context')
+ch_fetch = lazy_import('charmhelpers.fetch')
+
 
 class BaseCephClientCharm(ops_openstack.core.OSBaseCharm):
 
     def __init__(self, framework):
         super().__init__(framework)
+        self._bluestore_compression = None
+        self._stored.set_default(bluestore_compression_sent=None)
         super().register_status_check(self.check_bluestore_compression)
 
     def check_bluestore_compression(self):
         try:
-            self.get_bluestore_compression()
+            self.bluestore_compression()
             return ActiveStatus()
         except ValueError as e:
             return BlockedStatus(
                 'Invalid configuration: {}'.format(str(e)))
 
+    def bluestore_compression(self):
+        """Get BlueStore Compression charm configuration if present.
+
+        Unlike get_bluestore_compression() the context is only built and
+        validated once per hook, and again if the charm config changes, so
+        the status check and the code building Ceph broker requests share
+        the result.
+
+        :returns: Dictionary of options suitable for passing on as keyword
+                  arguments or None.
+        :rtype: Optional[Dict[str,any]]
+        :raises: ValueError
+        """
+        digest = config_digest(self.framework.model.config)
+        if (self._bluestore_compression is None or
+                self._bluestore_compression[0] != digest):
+            try:
+                self._bluestore_compression = (
+                    digest, self.get_bluestore_compression(), None)
+            except ValueError as e:
+                self._bluestore_compression = (digest, None, e)
+        _, kwargs, error = self._bluestore_compression
+        if error:
+            raise error
+        return kwargs
+
+    def bluestore_compression_changed(self):
+        """Whether the BlueStore Compression options need sending to Ceph.
+
+        Charms should only send a new broker request when this is True, and
+        call bluestore_compression_sent() once it has been sent.
+
+        :returns: Whether the options differ from those last sent.
+        :rtype: bool
+        :raises: ValueError
+        """
+        return (config_digest(self.bluestore_compression() or {}) !=
+                self._stored.bluestore_compression_sent)
+
+    def bluestore_compression_sent(self):
+        """Record the current BlueStore Compression options as sent."""
+        self._stored.bluestore_compression_sent = config_digest(
+            self.bluestore_compression() or {})
+
     @staticmethod
     def get_bluestore_compression():
         """Get BlueStore Compression charm configuration if present.
@@ -64,6 +114,15 @@ class BaseCephClientCharm(ops_openstack.core.OSBaseCharm):
 
 class CinderStoragePluginCharm(ops_openstack.core.OSBaseCharm):
 
+    # Set if cinder_configuration() only depends on the charm config, to skip
+    # publishing the backend data again when no option changed.
+    SKIP_UNCHANGED_CONFIG = False
+
+    # Set if cinder_configuration() only depends on the charm config, for
+    # the leader to compute it and share it with the other units over
+    # PEER_RELATION, see OSBaseCharm.shared_value().
+    SHARE_CINDER_CONFIGURATION = False
+
     def __init__(self, framework):
         super().__init__(framework)
         self.framework.observe(
@@ -71,10 +130,17 @@ class CinderStoragePluginCharm(ops_openstack.core.OSBaseCharm):
             self.on_storage_backend)
 
     def render_config(self, config, app_name):
+        if self.SHARE_CINDER_CONFIGURATION:
+            configuration = self.shared_value(
+                'cinder-configuration',
+                lambda: self.cinder_configuration(config),
+                inputs=config)
+        else:
+            configuration = self.cinder_configuration(config)
         return json.dumps({
             "cinder": {
                 "/etc/cinder/cinder.conf": {
-                    "sections": {app_name: self.cinder_configuration(config)}
+                    "sections": {app_name: configuration}
                 }
             }
         })
@@ -88,25 +154,57 @@ class CinderStoragePluginCharm(ops_openstack.core.OSBaseCharm):
             config, app_name)
 
     def on_config(self, event):
-        config = dict(self.framework.model.config)
-        app_name = self.framework.model.app.name
-        for relation in self.framework.model.relations.get('storage-backend'):
-            self.set_data(relation.data[self.unit], config, app_name)
+        if (not self.SKIP_UNCHANGED_CONFIG or self.config_delta is None or
+                self.config_delta):
+            config = dict(self.framework.model.config)
+            app_name = self.framework.model.app.name
+            with RelationDataBatch() as batch:
+                for relation in self.framework.model.relations.get(
+                        'storage-backend'):
+                    self.set_data(
+                        batch.bag(relation.data[self.unit]), config, app_name)
         self.unit.status = ActiveStatus('Unit is ready')
 
+    def config_impact(self, delta, config):
+        """Add the storage-backend relation data set_data() would change.
+
+        :returns: As OSBaseCharm.config_impact(), plus the keys that would be
+                  written for each relation ('relation-writes').
+        :rtype: Dict[str, any]
+        """
+        impact = super().config_impact(delta, config)
+        writes = {}
+        if delta:
+            app_name = self.framework.model.app.name
+            for relation in self.framework.model.relations.get(
+                    'storage-backend'):
+                data = {}
+                self.set_data(data, config, app_name)
+                current = relation.data[self.unit]
+                changed = sorted(
+                    key for key, value in data.items()
+                    if current.get(key) != value)
+                if changed:
+                    writes['{}:{}'.format(relation.name, relation.id)] = \
+                        changed
+        impact['relation-writes'] = writes
+        return impact
+
     def on_install(self, _):
         source = self.model.config.get('driver-source')
         if source:
-            add_source(source, self.model.config.get('driver-key'))
+            ch_fetch.add_source(source, self.model.config.get('driver-key'))
         apt_update(fatal=True)
         apt_install(self.PACKAGES, fatal=True)
         self.update_status()
 
+    @ops_openstack.core.coalesce
     def on_storage_backend(self, event):
-        self.set_data(
-            event.relation.data[self.unit],
-            self.framework.model.config,
-            self.framework.model.app.name)
+        with RelationDataBatch() as batch:
+            self.set_data(
+                batch.bag(event.relation.data[self.unit]),
+                self.framework.model.config,
+                self.framework.model.app.name)
 
     def cinder_configuration(self, charm_config):
         """Entry point for cinder subordinates.
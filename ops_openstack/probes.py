@@ -0,0 +1,160 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Status checks measuring the latency of the payload.
+
+A service can be running but too slow to be useful. A LatencyProbe samples
+a probe, for instance a HEAD request to a local API endpoint, several times
+and reports the unit as degraded when a percentile of the latencies is above
+a threshold. Probes are registered with OSBaseCharm.register_latency_probe().
+"""
+
+import http.client
+import logging
+import socket
+import time
+import urllib.parse
+
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+)
+
+from ops_openstack.history import percentile
+
+logger = logging.getLogger(__name__)
+
+
+def http_head(url, timeout=5):
+    """Create a probe sending a HEAD request to an HTTP endpoint.
+
+    Any HTTP response counts as a success, only the latency is of interest.
+
+    :param url: URL to probe, e.g. 'http://localhost:8776/'
+    :type url: str
+    :param timeout: Seconds to wait for a response.
+    :type timeout: float
+    :rtype: Callable[[], None]
+    """
+    parsed = urllib.parse.urlsplit(url)
+    connection_class = (http.client.HTTPSConnection
+                        if parsed.scheme == 'https'
+                        else http.client.HTTPConnection)
+
+    def _probe():
+        connection = connection_class(parsed.netloc, timeout=timeout)
+        try:
+            connection.request('HEAD', parsed.path or '/')
+            connection.getresponse().read()
+        finally:
+            connection.close()
+    return _probe
+
+
+def unix_socket_ping(path, payload=None, timeout=5):
+    """Create a probe connecting to a Unix socket.
+
+    :param path: Path of the socket.
+    :type path: str
+    :param payload: Bytes to send, after which a reply is awaited.
+    :type payload: Optional[bytes]
+    :param timeout: Seconds to wait for the connection and reply.
+    :type timeout: float
+    :rtype: Callable[[], None]
+    """
+    def _probe():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            if payload is not None:
+                sock.sendall(payload)
+                if not sock.recv(1):
+                    raise ConnectionError('no reply from {}'.format(path))
+    return _probe
+
+
+class LatencyProbe(object):
+    """Status check sampling the latency of a probe."""
+
+    def __init__(self, name, probe, samples=20, threshold=None, pct=95):
+        """
+        Percentiles are nearest-rank, with fewer than 100 / (100 - pct)
+        samples the percentile is the slowest sample, so a single slow
+        sample reports the unit as degraded.
+
+        :param name: Name of the probe used in status messages.
+        :type name: str
+        :param probe: Function raising an exception if the probe fails.
+        :type probe: Callable[[], None]
+        :param samples: Number of times to run the probe per check.
+        :type samples: int
+        :param threshold: Latency in milliseconds above which the unit is
+                          degraded, or a function returning it.
+        :type threshold: Optional[Union[float, Callable[[], float]]]
+        :param pct: Percentile of the latencies compared to the threshold.
+        :type pct: int
+        """
+        self.name = name
+        self.__name__ = '{}_probe'.format(name.replace('-', '_'))
+        self.probe = probe
+        self.samples = samples
+        self.threshold = threshold
+        self.pct = pct
+        self.latencies = []
+
+    def measure(self):
+        """Run the probe and return the latency of each run.
+
+        :returns: Latencies in milliseconds.
+        :rtype: List[float]
+        :raises: Exception raised by the probe.
+        """
+        latencies = []
+        for _ in range(self.samples):
+            start = time.monotonic()
+            self.probe()
+            latencies.append((time.monotonic() - start) * 1000)
+        return latencies
+
+    def __call__(self):
+        try:
+            self.latencies = self.measure()
+        except Exception as e:
+            logger.warning("Probe %s failed: %s", self.name, e)
+            return BlockedStatus('{} not responding: {}'.format(self.name, e))
+        threshold = self.threshold() if callable(self.threshold) else \
+            self.threshold
+        latency = percentile(self.latencies, self.pct)
+        logger.debug("Probe %s p%d %.1fms", self.name, self.pct, latency)
+        if threshold is not None and latency > threshold:
+            return ActiveStatus('degraded: {} p{} {:.0f}ms'.format(
+                self.name, self.pct, latency))
+        return ActiveStatus()
+
+
+def config_threshold(charm, option, default=None):
+    """Create a function reading a probe threshold from a config option.
+
+    :param charm: Charm the option belongs to.
+    :type charm: ops.charm.CharmBase
+    :param option: Config option holding the threshold in milliseconds.
+    :type option: str
+    :param default: Threshold if the option is not set.
+    :type default: Optional[float]
+    :rtype: Callable[[], Optional[float]]
+    """
+    def _threshold():
+        value = charm.model.config.get(option)
+        return default if value is None else float(value)
+    return _threshold
@@ -0,0 +1,65 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers for working with relation data."""
+
+import collections
+
+
+class RelationDataBatch(object):
+    """Stage writes to relation data bags and flush them together.
+
+    Assigning to a relation data bag key by key costs a relation-set call per
+    key. Writes staged in a batch are flushed with a single update() of each
+    data bag, which ops turns into one relation-set call for the keys whose
+    values changed.
+
+    Example::
+
+        with RelationDataBatch() as batch:
+            for relation in self.model.relations['amqp']:
+                data = batch.bag(relation.data[self.unit])
+                data['username'] = 'nova'
+                data['vhost'] = 'openstack'
+    """
+
+    def __init__(self):
+        self._staged = collections.OrderedDict()
+
+    def bag(self, databag):
+        """Get the staged writes for a relation data bag.
+
+        :param databag: Relation data bag, e.g. relation.data[self.unit]
+        :type databag: ops.model.RelationDataContent
+        :returns: Dictionary in which to stage writes to the data bag.
+        :rtype: Dict[str, str]
+        """
+        key = id(databag)
+        if key not in self._staged:
+            self._staged[key] = (databag, {})
+        return self._staged[key][1]
+
+    def flush(self):
+        """Write the staged data to each relation data bag."""
+        for databag, data in self._staged.values():
+            if data:
+                databag.update(data)
+        self._staged.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
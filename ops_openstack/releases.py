@@ -0,0 +1,150 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ordinals of OpenStack and Ceph releases.
+
+Releases are compared by explicit ordinal rather than by name, as the
+OpenStack codenames wrapped around the alphabet after zed.
+"""
+
+OPENSTACK = 'openstack'
+CEPH = 'ceph'
+
+OPENSTACK_ORDINALS = {
+    'diablo': 4,
+    'essex': 5,
+    'folsom': 6,
+    'grizzly': 7,
+    'havana': 8,
+    'icehouse': 9,
+    'juno': 10,
+    'kilo': 11,
+    'liberty': 12,
+    'mitaka': 13,
+    'newton': 14,
+    'ocata': 15,
+    'pike': 16,
+    'queens': 17,
+    'rocky': 18,
+    'stein': 19,
+    'train': 20,
+    'ussuri': 21,
+    'victoria': 22,
+    'wallaby': 23,
+    'xena': 24,
+    'yoga': 25,
+    'zed': 26,
+    'antelope': 27,
+    'bobcat': 28,
+    'caracal': 29,
+    'dalmatian': 30,
+    'epoxy': 31,
+}
+
+# Ceph ordinals match the major version from jewel (10) onwards.
+CEPH_ORDINALS = {
+    'firefly': 6,
+    'giant': 7,
+    'hammer': 8,
+    'infernalis': 9,
+    'jewel': 10,
+    'kraken': 11,
+    'luminous': 12,
+    'mimic': 13,
+    'nautilus': 14,
+    'octopus': 15,
+    'pacific': 16,
+    'quincy': 17,
+    'reef': 18,
+    'squid': 19,
+}
+
+# Stolen from charms.ceph
+UCA_CODENAME_MAP = {
+    'icehouse': 'firefly',
+    'juno': 'firefly',
+    'kilo': 'hammer',
+    'liberty': 'hammer',
+    'mitaka': 'jewel',
+    'newton': 'jewel',
+    'ocata': 'jewel',
+    'pike': 'luminous',
+    'queens': 'luminous',
+    'rocky': 'mimic',
+    'stein': 'mimic',
+    'train': 'nautilus',
+    'ussuri': 'octopus',
+    'victoria': 'octopus',
+    'wallaby': 'pacific',
+    'xena': 'pacific',
+    'yoga': 'quincy',
+    'zed': 'quincy',
+    'antelope': 'quincy',
+    'bobcat': 'reef',
+    'caracal': 'squid',
+    'dalmatian': 'squid',
+    'epoxy': 'squid',
+}
+
+ORDINALS = {
+    OPENSTACK: OPENSTACK_ORDINALS,
+    CEPH: CEPH_ORDINALS,
+}
+
+
+def track(release):
+    """Return the track, OPENSTACK or CEPH, a release belongs to.
+
+    :param release: Release codename
+    :type release: str
+    :returns: Track name or None if the release is unknown.
+    :rtype: Optional[str]
+    """
+    if release in OPENSTACK_ORDINALS:
+        return OPENSTACK
+    if release in CEPH_ORDINALS:
+        return CEPH
+    return None
+
+
+def ordinal(release):
+    """Return the ordinal of a release within its track.
+
+    :param release: Release codename
+    :type release: str
+    :rtype: int
+    :raises: KeyError if the release is unknown.
+    """
+    try:
+        return OPENSTACK_ORDINALS[release]
+    except KeyError:
+        return CEPH_ORDINALS[release]
+
+
+def to_track(release, target):
+    """Map a release to the equivalent release on another track.
+
+    :param release: Release codename
+    :type release: str
+    :param target: Track to map to, OPENSTACK or CEPH.
+    :type target: str
+    :returns: Release codename or None if there is no equivalent.
+    :rtype: Optional[str]
+    """
+    source = track(release)
+    if source == target:
+        return release
+    if source == OPENSTACK and target == CEPH:
+        return UCA_CODENAME_MAP.get(release)
+    return None
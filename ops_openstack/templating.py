@@ -0,0 +1,143 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Render templates with compiled templates cached on disk.
+
+Each hook runs in a new process, so Jinja would otherwise parse and compile
+every template on every hook. Compiled templates are kept in a bytecode
+cache, which Jinja checks against a checksum of the template source and its
+own version, in a directory named after CACHE_VERSION and the Jinja version.
+One environment is kept per templates and cache directory for the life of
+the process.
+"""
+
+import collections.abc
+import os
+import shutil
+import tempfile
+
+from ops_openstack.lazy import lazy_import
+
+jinja2 = lazy_import('jinja2')
+
+# Bump when the environment settings change the compiled templates.
+CACHE_VERSION = 1
+
+_environments = {}
+
+
+def _versioned_cache_dir(cache_dir):
+    """Create the cache directory for this version, removing others.
+
+    :param cache_dir: Directory holding the caches of all versions.
+    :type cache_dir: str
+    :returns: Directory for this version.
+    :rtype: str
+    """
+    version = '{}-jinja{}'.format(CACHE_VERSION, jinja2.__version__)
+    path = os.path.join(cache_dir, version)
+    os.makedirs(path, exist_ok=True)
+    for entry in os.listdir(cache_dir):
+        if entry != version:
+            shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+    return path
+
+
+def get_environment(templates_dir, cache_dir=None):
+    """Get the Jinja environment for a templates directory.
+
+    :param templates_dir: Directory templates are loaded from.
+    :type templates_dir: str
+    :param cache_dir: Directory compiled templates are cached in, nothing
+                      is cached on disk if None.
+    :type cache_dir: Optional[str]
+    :rtype: jinja2.Environment
+    """
+    key = (str(templates_dir), cache_dir and str(cache_dir))
+    if key not in _environments:
+        bytecode_cache = None
+        if cache_dir:
+            try:
+                bytecode_cache = jinja2.FileSystemBytecodeCache(
+                    _versioned_cache_dir(str(cache_dir)))
+            except OSError:
+                # Rendering still works, only slower.
+                pass
+        _environments[key] = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(str(templates_dir)),
+            bytecode_cache=bytecode_cache)
+    return _environments[key]
+
+
+def render_template(source, context, templates_dir, cache_dir=None):
+    """Render a template to a string.
+
+    :param source: Template name, relative to templates_dir.
+    :type source: str
+    :param context: Template context, a mapping or an iterable of
+                    (name, value) pairs such as OpenStackRelationAdapters.
+    :type context: Union[Mapping[str, any], Iterable[Tuple[str, any]]]
+    :param templates_dir: Directory templates are loaded from.
+    :type templates_dir: str
+    :param cache_dir: Directory compiled templates are cached in.
+    :type cache_dir: Optional[str]
+    :rtype: str
+    """
+    if not isinstance(context, collections.abc.Mapping):
+        context = dict(context)
+    template = get_environment(templates_dir, cache_dir).get_template(source)
+    return template.render(context)
+
+
+def render(source, target, context, templates_dir, cache_dir=None,
+           perms=0o444):
+    """Render a template to a file.
+
+    The file is replaced atomically, and only if its contents change.
+
+    :param source: Template name, relative to templates_dir.
+    :type source: str
+    :param target: File to write.
+    :type target: str
+    :param context: Template context, see render_template().
+    :type context: Union[Mapping[str, any], Iterable[Tuple[str, any]]]
+    :param templates_dir: Directory templates are loaded from.
+    :type templates_dir: str
+    :param cache_dir: Directory compiled templates are cached in.
+    :type cache_dir: Optional[str]
+    :param perms: Mode of the file.
+    :type perms: int
+    :returns: Whether the file was written.
+    :rtype: bool
+    """
+    content = render_template(
+        source, context, templates_dir, cache_dir).encode('utf-8')
+    try:
+        with open(target, 'rb') as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    directory = os.path.dirname(os.path.abspath(target))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp, perms)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
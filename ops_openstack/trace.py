@@ -0,0 +1,389 @@
+# Copyright 2020 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record the external inputs of a hook and replay them offline.
+
+While recording, the functions in TARGETS are wrapped so that their
+arguments, results and durations are saved. Along with a snapshot of the
+model (config, leadership, relation data and stored state) taken when the
+hook starts, they are written to a gzipped JSON trace file.
+
+replay() runs a charm against a trace under ops.testing.Harness, answering
+the recorded calls from the trace, so hook latency can be measured away from
+the unit:
+
+    result = replay(MyCharm, 'update-status-1601027400000.trace')
+    print(result.duration, result.recorded_duration)
+
+Relation ids are assigned by the Harness on replay, code passing relation
+ids obtained from the ops model to recorded functions will not find the
+recorded response.
+"""
+
+import collections
+import collections.abc
+import functools
+import gzip
+import json
+import os
+import sys
+import time
+
+from ops.model import ModelError
+
+TRACE_VERSION = 1
+
+# Functions whose calls are recorded, as (module, attribute path).
+TARGETS = [
+    ('ops_openstack.hooktools', 'is_leader'),
+    ('ops_openstack.fetch', 'apt_install'),
+    ('ops_openstack.fetch', 'apt_update'),
+    ('ops_openstack.core', 'apt_install'),
+    ('ops_openstack.core', 'apt_update'),
+    ('ops_openstack.plugins.classes', 'apt_install'),
+    ('ops_openstack.plugins.classes', 'apt_update'),
+    ('ops_openstack.core', 'os_utils.manage_payload_services'),
+    ('ops_openstack.core', 'os_utils.ows_check_services_running'),
+    ('ops_openstack.core', 'os_utils.get_os_codename_install_source'),
+    ('ops_openstack.aio', 'os_utils.manage_payload_services'),
+    ('ops_openstack.aio', 'os_utils.ows_check_services_running'),
+    ('ops_openstack.aio', 'os_utils.get_os_codename_install_source'),
+]
+
+# Environment variables describing the hook being run.
+HOOK_ENVIRONMENT = [
+    'JUJU_HOOK_NAME',
+    'JUJU_ACTION_NAME',
+    'JUJU_RELATION',
+    'JUJU_RELATION_ID',
+    'JUJU_REMOTE_UNIT',
+    'JUJU_REMOTE_APP',
+]
+
+
+class TraceError(Exception):
+    """Error replaying a trace."""
+
+
+class RecordedError(TraceError):
+    """Exception recorded in a trace, raised again on replay."""
+
+    def __init__(self, exc_type, message):
+        super().__init__('{}: {}'.format(exc_type, message))
+        self.exc_type = exc_type
+
+
+def _key(args, kwargs):
+    return json.dumps([args, kwargs], sort_keys=True, default=str)
+
+
+def _resolve(targets):
+    """Find the objects owning the target functions.
+
+    Modules that have not been imported are skipped, as is a function
+    already reached through another target.
+
+    :returns: Owner, attribute name and function of each target.
+    :rtype: List[Tuple[object, str, Callable]]
+    """
+    resolved = []
+    seen = set()
+    for module, path in targets:
+        owner = sys.modules.get(module)
+        *parents, attr = path.split('.')
+        for parent in parents:
+            owner = getattr(owner, parent, None)
+        func = getattr(owner, attr, None)
+        if func is None or (id(owner), attr) in seen:
+            continue
+        seen.add((id(owner), attr))
+        resolved.append((owner, attr, func))
+    return resolved
+
+
+def _name(func):
+    return '{}.{}'.format(
+        getattr(func, '__module__', None), getattr(func, '__name__', func))
+
+
+class _Patcher(object):
+
+    def __init__(self, targets=None):
+        self.targets = TARGETS if targets is None else targets
+        self._patched = []
+
+    def wrap(self, name, func):
+        raise NotImplementedError
+
+    def start(self):
+        for owner, attr, func in _resolve(self.targets):
+            self._patched.append((owner, attr, func))
+            setattr(owner, attr, self.wrap(_name(func), func))
+
+    def stop(self):
+        while self._patched:
+            owner, attr, func = self._patched.pop()
+            setattr(owner, attr, func)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class Recorder(_Patcher):
+    """Record the calls made to the target functions."""
+
+    def __init__(self, targets=None):
+        super().__init__(targets)
+        self.calls = []
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def _recorded(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.calls.append([
+                    name, _key(args, kwargs), None,
+                    [type(e).__name__, str(e)], time.monotonic() - start])
+                raise
+            # Saved as it will be replayed, e.g. with tuples as lists.
+            self.calls.append([
+                name, _key(args, kwargs),
+                json.loads(json.dumps(result, default=str)), None,
+                time.monotonic() - start])
+            return result
+        return _recorded
+
+
+class Player(_Patcher):
+    """Answer calls to the target functions from recorded calls.
+
+    Calls are answered in the order they were recorded for the same
+    arguments, the last response being repeated once they run out. Calls
+    that were not recorded raise TraceError.
+    """
+
+    def __init__(self, calls, targets=None, realtime=False):
+        """
+        :param calls: Calls from a trace.
+        :type calls: List[List]
+        :param targets: Functions to answer, defaults to TARGETS.
+        :type targets: Optional[List[Tuple[str, str]]]
+        :param realtime: Whether to take as long as the recorded calls.
+        :type realtime: bool
+        """
+        super().__init__(targets)
+        self.realtime = realtime
+        self.misses = 0
+        self._responses = collections.defaultdict(collections.deque)
+        for name, key, result, error, duration in calls:
+            self._responses[(name, key)].append((result, error, duration))
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def _replayed(*args, **kwargs):
+            responses = self._responses.get((name, _key(args, kwargs)))
+            if not responses:
+                self.misses += 1
+                raise TraceError('No recorded call to {}{}'.format(
+                    name, _key(args, kwargs)))
+            result, error, duration = (
+                responses.popleft() if len(responses) > 1 else responses[0])
+            if self.realtime:
+                time.sleep(duration)
+            if error:
+                raise RecordedError(*error)
+            return result
+        return _replayed
+
+
+def write(path, trace):
+    """Write a trace file.
+
+    The file is only readable by its owner, as traces hold the charm config
+    and relation data, including credentials.
+
+    :param path: Trace file
+    :type path: Union[str, pathlib.Path]
+    :param trace: Trace contents
+    :type trace: Dict
+    """
+    fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, 'wb') as raw:
+        os.fchmod(fd, 0o600)
+        with gzip.open(raw, 'wt', encoding='utf-8') as f:
+            json.dump(trace, f, separators=(',', ':'), default=str)
+
+
+def load(path):
+    """Read a trace file.
+
+    :param path: Trace file
+    :type path: Union[str, pathlib.Path]
+    :rtype: Dict
+    :raises: ValueError if the trace was written by an unknown version.
+    """
+    with gzip.open(str(path), 'rt', encoding='utf-8') as f:
+        trace = json.load(f)
+    if trace.get('version') != TRACE_VERSION:
+        raise ValueError(
+            'Unsupported trace version {}'.format(trace.get('version')))
+    return trace
+
+
+def snapshot(charm):
+    """Capture the state of the model a hook starts from.
+
+    :param charm: Charm being run.
+    :type charm: ops.charm.CharmBase
+    :rtype: Dict
+    """
+    relations = []
+    for name, relation_list in charm.model.relations.items():
+        for relation in relation_list:
+            try:
+                app_data = dict(relation.data[relation.app])
+            except (KeyError, ModelError):
+                # No remote application yet, or the application data of a
+                # peer relation read by a non-leader.
+                app_data = {}
+            relations.append({
+                'name': name,
+                'id': relation.id,
+                'app': relation.app.name if relation.app else None,
+                'app_data': app_data,
+                'local': dict(relation.data[charm.unit]),
+                'units': {
+                    unit.name: dict(relation.data[unit])
+                    for unit in relation.units}})
+    return {
+        'version': TRACE_VERSION,
+        'env': {var: os.environ.get(var) for var in HOOK_ENVIRONMENT},
+        'leader': charm.unit.is_leader(),
+        'config': dict(charm.model.config),
+        'relations': relations,
+    }
+
+
+def _plain(value):
+    if isinstance(value, collections.abc.Mapping):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, collections.abc.Set):
+        return sorted(_plain(v) for v in value)
+    if isinstance(value, collections.abc.MutableSequence):
+        return [_plain(v) for v in value]
+    return value
+
+
+def stored_snapshot(stored, names):
+    """Capture stored state attributes as plain JSON compatible values.
+
+    Sets are recorded as sorted lists.
+
+    :param stored: Stored state of the charm.
+    :type stored: ops.framework.BoundStoredState
+    :param names: Attributes to capture, those not set are skipped.
+    :type names: Iterable[str]
+    :rtype: Dict[str, any]
+    """
+    return {
+        name: _plain(getattr(stored, name))
+        for name in sorted(names) if hasattr(stored, name)}
+
+
+ReplayResult = collections.namedtuple(
+    'ReplayResult',
+    ['hook', 'duration', 'recorded_duration', 'calls', 'misses', 'status'])
+
+
+def _emit(harness, trace, relation_ids):
+    env = trace['env']
+    if env.get('JUJU_ACTION_NAME'):
+        harness.run_action(
+            env['JUJU_ACTION_NAME'], trace.get('action_params') or {})
+        return
+    hook = env['JUJU_HOOK_NAME']
+    if '-relation-' in hook:
+        name, kind = hook.split('-relation-')
+        recorded_id = int(env['JUJU_RELATION_ID'].split(':')[-1])
+        relation = harness.model.get_relation(
+            name, relation_ids.get(recorded_id))
+        app = harness.model.get_app(env['JUJU_REMOTE_APP']) \
+            if env.get('JUJU_REMOTE_APP') else None
+        unit = harness.model.get_unit(env['JUJU_REMOTE_UNIT']) \
+            if env.get('JUJU_REMOTE_UNIT') else None
+        getattr(harness.charm.on[name], 'relation_' + kind).emit(
+            relation, app, unit)
+        return
+    getattr(harness.charm.on, hook.replace('-', '_')).emit()
+
+
+def replay(charm_class, path, meta=None, actions=None, config=None,
+           realtime=False):
+    """Run the hook recorded in a trace file.
+
+    :param charm_class: Charm class the trace was recorded with.
+    :type charm_class: Type[ops.charm.CharmBase]
+    :param path: Trace file
+    :type path: Union[str, pathlib.Path]
+    :param meta: metadata.yaml contents, see ops.testing.Harness.
+    :type meta: Optional[str]
+    :param actions: actions.yaml contents, see ops.testing.Harness.
+    :type actions: Optional[str]
+    :param config: config.yaml contents, see ops.testing.Harness.
+    :type config: Optional[str]
+    :param realtime: Whether recorded calls take as long as they did.
+    :type realtime: bool
+    :rtype: ReplayResult
+    """
+    from ops.testing import Harness
+
+    trace = load(path)
+    harness = Harness(charm_class, meta=meta, actions=actions, config=config)
+    try:
+        harness.set_leader(trace['leader'])
+        harness.update_config(trace['config'])
+        relation_ids = {}
+        for relation in trace['relations']:
+            rid = harness.add_relation(relation['name'], relation['app'])
+            relation_ids[relation['id']] = rid
+            for unit, data in relation['units'].items():
+                harness.add_relation_unit(rid, unit)
+                harness.update_relation_data(rid, unit, data)
+            if relation['app_data']:
+                harness.update_relation_data(
+                    rid, relation['app'], relation['app_data'])
+            if relation['local']:
+                harness.update_relation_data(
+                    rid, harness.model.unit.name, relation['local'])
+        harness.begin()
+        for key, value in trace.get('stored', {}).items():
+            setattr(harness.charm._stored, key, value)
+        with Player(trace['calls'], realtime=realtime) as player:
+            start = time.monotonic()
+            _emit(harness, trace, relation_ids)
+            duration = time.monotonic() - start
+        status = harness.model.unit.status
+    finally:
+        harness.cleanup()
+    hook = (trace['env'].get('JUJU_HOOK_NAME') or
+            trace['env'].get('JUJU_ACTION_NAME'))
+    return ReplayResult(
+        hook, duration, trace.get('duration'), len(trace['calls']),
+        player.misses, status)
@@ -12,7 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from unittest.mock import patch
+import pathlib
+import tempfile
+from unittest.mock import patch, PropertyMock
 
 
 # Patch out lsb_release() and get_platform() as unit tests should be fully
@@ -26,3 +28,24 @@ patch(
     return_value={
         'DISTRIB_CODENAME': 'jammy'
     }).start()
+
+
+def patch_charm_dir(test, charm_class):
+    """Give instances of charm_class an empty temporary charm directory.
+
+    :param test: Test case the patch and directory are cleaned up with.
+    :type test: unittest.TestCase
+    :param charm_class: Charm class to patch.
+    :type charm_class: Type[ops.charm.CharmBase]
+    :returns: The charm directory.
+    :rtype: pathlib.Path
+    """
+    tmpdir = tempfile.TemporaryDirectory()
+    test.addCleanup(tmpdir.cleanup)
+    charm_dir = pathlib.Path(tmpdir.name)
+    _p = patch.object(
+        charm_class, 'charm_dir',
+        new_callable=PropertyMock, return_value=charm_dir)
+    _p.start()
+    test.addCleanup(_p.stop)
+    return charm_dir
@@ -0,0 +1,191 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import types
+import unittest
+
+from ops.charm import CharmBase
+from ops.framework import Object
+from ops.testing import Harness
+
+import ops_openstack.adapters as adapters
+
+
+class ClusterPeers(Object):
+
+    def __init__(self, charm, endpoint_name):
+        super().__init__(charm, endpoint_name)
+        self.endpoint_name = endpoint_name
+
+    @property
+    def units(self):
+        return 'interface units'
+
+    @property
+    def peer_count(self):
+        return len(self.model.get_relation(self.endpoint_name).units)
+
+
+class ClusterCharm(CharmBase):
+
+    def __init__(self, framework):
+        super().__init__(framework)
+        self.cluster = ClusterPeers(self, 'cluster')
+
+
+class ClusterAdapters(adapters.OpenStackRelationAdapters):
+
+    relation_adapters = {
+        'cluster': adapters.OpenStackAggregateRelationAdapter,
+    }
+
+
+class TestOpenStackAggregateRelationAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.harness = Harness(ClusterCharm, meta='''
+            name: client
+            peers:
+              cluster:
+                interface: cluster
+        ''', config='''
+            options:
+              debug:
+                type: boolean
+                default: False
+        ''')
+        self.addCleanup(self.harness.cleanup)
+        self.rid = self.harness.add_relation('cluster', 'client')
+        for unit, data in [
+                ('client/10', {'private-address': '10.0.0.10',
+                               'weight': '2'}),
+                ('client/2', {'ingress-address': '10.0.0.2',
+                              'private-address': '192.168.0.2'}),
+                ('client/3', {})]:
+            self.harness.add_relation_unit(self.rid, unit)
+            self.harness.update_relation_data(self.rid, unit, data)
+        self.harness.begin()
+
+    def test_views(self):
+        context = ClusterAdapters(
+            [self.harness.charm.cluster], self.harness.charm)
+        cluster = context.cluster
+        self.assertIsInstance(
+            cluster, adapters.OpenStackAggregateRelationAdapter)
+        self.assertEqual(cluster.units, ['client/2', 'client/3', 'client/10'])
+        self.assertEqual(cluster.addresses, ['10.0.0.2', '10.0.0.10'])
+        self.assertEqual(cluster.values('weight'), [None, None, '2'])
+        self.assertEqual(cluster.values('missing'), [None, None, None])
+        self.assertEqual(
+            cluster.columns['private-address'],
+            ['192.168.0.2', None, '10.0.0.10'])
+        self.assertEqual(cluster.unit_data('client/10')['weight'], '2')
+        # Interface properties are still available, unless they clash with
+        # a view.
+        self.assertEqual(cluster.peer_count, 3)
+
+    def test_refresh(self):
+        cluster = adapters.OpenStackAggregateRelationAdapter(
+            self.harness.charm.cluster)
+        self.assertEqual(cluster.values('weight'), [None, None, '2'])
+        self.harness.update_relation_data(
+            self.rid, 'client/2', {'weight': '1'})
+        self.assertEqual(cluster.values('weight'), [None, None, '2'])
+        cluster.refresh()
+        self.assertEqual(cluster.values('weight'), ['1', None, '2'])
+
+    def test_to_context(self):
+        context = ClusterAdapters(
+            [self.harness.charm.cluster], self.harness.charm).to_context()
+        self.assertEqual(
+            context['cluster'].addresses, ('10.0.0.2', '10.0.0.10'))
+        self.assertEqual(context['cluster'].peer_count, 3)
+        self.assertEqual(context['options'].debug, False)
+        self.assertNotIn('charm_instance', context['options']._fields)
+        with self.assertRaises(AttributeError):
+            context['cluster'].peer_count = 4
+        with self.assertRaises(TypeError):
+            context['options'] = {}
+
+    def test_to_context_keys(self):
+        context = ClusterAdapters(
+            [self.harness.charm.cluster], self.harness.charm).to_context(
+                keys=['cluster.units', 'options.debug'])
+        self.assertEqual(
+            context['cluster']._asdict(),
+            {'units': ('client/2', 'client/3', 'client/10')})
+        self.assertEqual(context['options']._asdict(), {'debug': False})
+
+    def test_to_context_option_names(self):
+        class Options(adapters.ConfigurationAdapter):
+
+            @property
+            def debug(self):
+                return 'from property'
+
+        harness = Harness(ClusterCharm, meta='''
+            name: client
+        ''', config='''
+            options:
+              debug:
+                type: boolean
+                default: False
+              worker-multiplier:
+                type: float
+                default: 2.0
+              class:
+                type: string
+                default: x
+              2fa:
+                type: boolean
+                default: False
+        ''')
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        context = adapters.OpenStackRelationAdapters([], harness.charm)
+        context.options = Options(harness.charm)
+        options = context.to_context()['options']
+        self.assertEqual(
+            sorted(options._fields), ['debug', 'worker_multiplier'])
+        self.assertEqual(options.debug, 'from property')
+        self.assertEqual(options.worker_multiplier, 2.0)
+
+    def test_configuration_adapter(self):
+        options = adapters.ConfigurationAdapter(self.harness.charm)
+        self.assertIs(options.debug, False)
+        # The config is copied when the adapter is created.
+        self.harness.update_config({'debug': True})
+        self.assertIs(options.debug, False)
+        self.assertIs(
+            adapters.ConfigurationAdapter(self.harness.charm).debug, True)
+        with self.assertRaises(AttributeError):
+            options.missing
+        options.missing = 'set'
+        self.assertEqual(options.missing, 'set')
+        self.assertEqual(vars(options)['missing'], 'set')
+
+    def test_configuration_adapter_option_names(self):
+        config = {'worker-multiplier': 2.0, 'use-syslog': False}
+        charm = ClusterCharm.__new__(ClusterCharm)
+        charm.framework = types.SimpleNamespace(
+            model=types.SimpleNamespace(config=config))
+        options = adapters.ConfigurationAdapter(charm)
+        self.assertEqual(options.worker_multiplier, 2.0)
+        self.assertIs(options.use_syslog, False)
+        config['use_syslog'] = True
+        options = adapters.ConfigurationAdapter(charm)
+        # An option's own name wins.
+        self.assertIs(options.use_syslog, True)
+        with self.assertRaises(AttributeError):
+            options.debug
@@ -0,0 +1,70 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+import unittest
+
+from mock import patch
+
+import ops_openstack.aio as aio
+
+
+class TestAio(unittest.TestCase):
+
+    @patch.object(aio, 'os_utils')
+    @patch.object(aio, 'fetch')
+    def test_wrappers(self, fetch, os_utils):
+        os_utils.ows_check_services_running.return_value = (None, None)
+        os_utils.get_os_codename_install_source.return_value = 'caracal'
+        results = aio.run(aio.gather(
+            aio.apt_update(fatal=True),
+            aio.apt_install(['pkg'], fatal=True),
+            aio.manage_payload_services('pause', services=['svc']),
+            aio.ows_check_services_running(['svc'], ports=[]),
+            aio.get_os_codename_install_source('distro')))
+        self.assertEqual(results[3:], [(None, None), 'caracal'])
+        fetch.apt_update.assert_called_once_with(fatal=True)
+        fetch.apt_install.assert_called_once_with(
+            ['pkg'], options=None, fatal=True)
+        os_utils.manage_payload_services.assert_called_once_with(
+            'pause', services=['svc'], charm_func=None)
+        os_utils.ows_check_services_running.assert_called_once_with(
+            ['svc'], ports=[])
+
+    def test_bounded_concurrency(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def _work():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        with patch.object(aio, 'MAX_CONCURRENCY', 2):
+            aio.run(aio.gather(*[aio.call(_work) for _ in range(6)]))
+        self.assertEqual(running[1], 2)
+
+    def test_deadline(self):
+        async def _slow():
+            await asyncio.sleep(10)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            aio.run(aio.gather(_slow(), deadline=time.monotonic() + 0.01))
+        with self.assertRaises(asyncio.TimeoutError):
+            aio.run(_slow(), deadline=time.monotonic())
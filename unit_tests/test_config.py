@@ -0,0 +1,101 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from ops_openstack.config import (
+    ConfigDelta,
+    ConfigOption,
+    ConfigValidator,
+    config_digest,
+)
+
+
+def _ports_differ(values):
+    if values.get('port') == values.get('admin-port'):
+        return 'port and admin-port must differ'
+
+
+class TestConfigValidator(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.validator = ConfigValidator(
+            schema={
+                'port': ConfigOption(int, minimum=1, maximum=65535),
+                'admin-port': ConfigOption(int),
+                'debug': ConfigOption(bool),
+                'log-level': ConfigOption(str, choices=['debug', 'info']),
+                'driver': ConfigOption(str, required=True)},
+            mandatory=['source'],
+            rules=[_ports_differ])
+
+    def test_valid(self):
+        result = self.validator.validate({
+            'port': '8776',
+            'debug': 'True',
+            'driver': 'lvm',
+            'source': 'distro'})
+        self.assertTrue(result)
+        self.assertEqual(result.values['port'], 8776)
+        self.assertIs(result.values['debug'], True)
+        self.assertEqual(result.message, '')
+
+    def test_all_errors_reported(self):
+        result = self.validator.validate({
+            'port': 0,
+            'debug': 'maybe',
+            'log-level': 'trace'})
+        self.assertFalse(result)
+        self.assertEqual(result.missing, ['driver', 'source'])
+        self.assertEqual(
+            result.message,
+            "Missing option(s): driver,source, Invalid configuration: "
+            "debug: invalid value 'maybe'; log-level: must be one of "
+            "debug, info; port: must be at least 1")
+
+    def test_rules(self):
+        result = self.validator.validate({
+            'port': 80,
+            'admin-port': 80,
+            'driver': 'lvm',
+            'source': 'distro'})
+        self.assertEqual(result.errors, ['port and admin-port must differ'])
+
+    def test_config_digest(self):
+        self.assertEqual(
+            config_digest({'a': 1, 'b': 'x'}),
+            config_digest({'b': 'x', 'a': 1}))
+        self.assertNotEqual(
+            config_digest({'a': 1}),
+            config_digest({'a': 2}))
+
+
+class TestConfigDelta(unittest.TestCase):
+
+    def test_initial(self):
+        delta = ConfigDelta(None, {'a': 1})
+        self.assertTrue(delta)
+        self.assertTrue(delta.affects(['b']))
+
+    def test_delta(self):
+        delta = ConfigDelta({'a': 1, 'b': 2, 'c': 3}, {'a': 1, 'b': 4, 'd': 5})
+        self.assertEqual(delta.added, {'d'})
+        self.assertEqual(delta.removed, {'c'})
+        self.assertEqual(delta.changed, {'b'})
+        self.assertTrue(delta.affects(['a', 'b']))
+        self.assertFalse(delta.affects(['a']))
+
+    def test_no_change(self):
+        self.assertFalse(ConfigDelta({'a': 1}, {'a': 1}))
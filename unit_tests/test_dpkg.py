@@ -0,0 +1,90 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from mock import patch
+
+import ops_openstack.dpkg as dpkg
+
+STATUS = """Package: keystone
+Status: install ok installed
+Architecture: all
+Version: 2:25.0.0-0ubuntu1
+Description: OpenStack identity service
+
+Package: libc6
+Status: deinstall ok config-files
+Architecture: i386
+Version: 2.35-0ubuntu3
+
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Version: 2.35-0ubuntu3.8
+
+Package: keystone-common
+Status: deinstall ok config-files
+Version: 2:24.0.0-0ubuntu1
+"""
+
+
+class TestDpkg(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'status')
+        with open(self.path, 'w') as f:
+            f.write(STATUS)
+
+    def test_installed_versions(self):
+        self.assertEqual(
+            dpkg.installed_versions(
+                ['keystone', 'libc6', 'keystone-common', 'nova'],
+                path=self.path),
+            {'keystone': '2:25.0.0-0ubuntu1',
+             'libc6': '2.35-0ubuntu3.8',
+             'keystone-common': None,
+             'nova': None})
+
+    def test_cached_until_modified(self):
+        with patch.object(dpkg, '_scan', wraps=dpkg._scan) as scan:
+            dpkg.installed_versions(['keystone'], path=self.path)
+            dpkg.installed_versions(['keystone'], path=self.path)
+            self.assertEqual(scan.call_count, 1)
+            with open(self.path, 'a') as f:
+                f.write('\nPackage: nova\nStatus: install ok installed\n'
+                        'Version: 3:30.0.0-0ubuntu1\n')
+            self.assertEqual(
+                dpkg.installed_versions(['nova'], path=self.path),
+                {'nova': '3:30.0.0-0ubuntu1'})
+            self.assertEqual(scan.call_count, 2)
+
+    def test_missing_or_empty(self):
+        self.assertEqual(
+            dpkg.installed_versions(['keystone'], path=self.path + '.x'),
+            {'keystone': None})
+        open(self.path, 'w').close()
+        self.assertEqual(
+            dpkg.installed_versions(['keystone'], path=self.path),
+            {'keystone': None})
+
+    def test_upstream_version(self):
+        self.assertEqual(
+            dpkg.upstream_version('2:25.0.0-0ubuntu1'), '25.0.0')
+        self.assertEqual(dpkg.upstream_version('1.2'), '1.2')
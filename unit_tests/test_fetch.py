@@ -0,0 +1,112 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from mock import patch
+
+import ops_openstack.fetch
+
+
+class TestFetch(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.sources = os.path.join(self.tmpdir.name, 'sources.list')
+        with open(self.sources, 'w'):
+            pass
+        os.utime(self.sources, (0, 0))
+        for attr, value in [('LOCK_DIR', self.tmpdir.name),
+                            ('APT_SOURCES', [self.sources])]:
+            _p = patch.object(ops_openstack.fetch, attr, value)
+            _p.start()
+            self.addCleanup(_p.stop)
+        _p = patch.object(ops_openstack.fetch, 'ch_fetch')
+        self.ch_fetch = _p.start()
+        self.addCleanup(_p.stop)
+
+    def queue(self, entries=None):
+        path = os.path.join(self.tmpdir.name, 'apt.queue')
+        if entries is not None:
+            with open(path, 'w') as f:
+                json.dump(entries, f)
+        with open(path) as f:
+            return json.load(f)
+
+    def test_apt_update_collapsed(self):
+        ops_openstack.fetch.apt_update(fatal=True)
+        ops_openstack.fetch.apt_update(fatal=True)
+        self.ch_fetch.apt_update.assert_called_once_with(fatal=True)
+
+    def test_apt_update_window_expired(self):
+        ops_openstack.fetch.apt_update(fatal=True)
+        ops_openstack.fetch.apt_update(fatal=True, window=0)
+        self.assertEqual(self.ch_fetch.apt_update.call_count, 2)
+
+    def test_apt_update_sources_changed(self):
+        ops_openstack.fetch.apt_update(fatal=True)
+        os.utime(self.sources, (time.time() + 1, time.time() + 1))
+        ops_openstack.fetch.apt_update(fatal=True)
+        self.assertEqual(self.ch_fetch.apt_update.call_count, 2)
+
+    def test_apt_install(self):
+        ops_openstack.fetch.apt_install('pkg1', fatal=True)
+        self.ch_fetch.apt_install.assert_called_once_with(
+            ['pkg1'], options=None, fatal=True)
+        self.assertEqual(self.queue(), [])
+
+    def test_apt_install_merges_pending(self):
+        self.queue([
+            {'id': 'other', 'pid': os.getpid(), 'packages': ['pkg2'],
+             'options': None, 'fatal': True},
+            {'id': 'dl', 'pid': os.getpid(), 'packages': ['pkg3'],
+             'options': ['--download-only'], 'fatal': True}])
+        ops_openstack.fetch.apt_install(['pkg1'], fatal=True)
+        self.ch_fetch.apt_install.assert_called_once_with(
+            ['pkg1', 'pkg2'], options=None, fatal=True)
+        self.assertEqual([e['id'] for e in self.queue()], ['dl'])
+
+    def test_apt_install_batches_by_fatal(self):
+        self.queue([
+            {'id': 'other', 'pid': os.getpid(), 'packages': ['pkg2'],
+             'options': None, 'fatal': True}])
+        ops_openstack.fetch.apt_install(['pkg1'], fatal=False)
+        self.ch_fetch.apt_install.assert_called_once_with(
+            ['pkg1'], options=None, fatal=False)
+        self.assertEqual([e['id'] for e in self.queue()], ['other'])
+
+    def test_apt_install_drops_dead_requests(self):
+        with patch.object(ops_openstack.fetch, '_pid_running') as running:
+            running.side_effect = lambda pid: pid == os.getpid()
+            self.queue([
+                {'id': 'other', 'pid': -1, 'packages': ['pkg2'],
+                 'options': None, 'fatal': True}])
+            ops_openstack.fetch.apt_install(['pkg1'], fatal=True)
+        self.ch_fetch.apt_install.assert_called_once_with(
+            ['pkg1'], options=None, fatal=True)
+
+    def test_apt_install_failure_requeues_others(self):
+        self.queue([
+            {'id': 'other', 'pid': os.getpid(), 'packages': ['pkg2'],
+             'options': None, 'fatal': True}])
+        self.ch_fetch.apt_install.side_effect = OSError('apt failed')
+        with self.assertRaises(OSError):
+            ops_openstack.fetch.apt_install(['pkg1'], fatal=True)
+        self.assertEqual([e['id'] for e in self.queue()], ['other'])
@@ -0,0 +1,67 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+import ops_openstack.history as history
+
+
+class TestStatusHistory(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'history')
+
+    def test_ring_buffer(self):
+        ring = history.StatusHistory(self.path, capacity=3)
+        for i in range(5):
+            ring.append(
+                history.EVALUATION, float(i), 0.5, status='active',
+                checks=[('check_a', 0.1), ('check_b', 0.2)])
+        size = os.path.getsize(self.path)
+        ring.append(history.HOOK, 5.0, 2.0, name='update-status')
+        self.assertEqual(os.path.getsize(self.path), size)
+        records = ring.records()
+        self.assertEqual(
+            [r['timestamp'] for r in records], [3.0, 4.0, 5.0])
+        self.assertEqual(records[0]['status'], 'active')
+        self.assertEqual(
+            [c[0] for c in records[0]['checks']], ['check_a', 'check_b'])
+        self.assertAlmostEqual(records[0]['checks'][1][1], 0.2)
+        self.assertEqual(records[2]['name'], 'update-status')
+
+    def test_summary(self):
+        ring = history.StatusHistory(self.path)
+        for duration in (0.1, 0.2, 0.3, 0.4):
+            ring.append(
+                history.EVALUATION, 0.0, duration, status='blocked',
+                checks=[('fast', 0.001), ('slow', duration)])
+        ring.append(history.HOOK, 0.0, 1.0, name='config-changed')
+        summary = ring.summary()
+        self.assertEqual(summary['evaluations'], 4)
+        self.assertEqual(summary['statuses'], {'blocked': 4})
+        self.assertEqual(summary['duration']['p50'], 200.0)
+        self.assertEqual(summary['duration']['p99'], 400.0)
+        self.assertEqual(
+            [c['name'] for c in summary['checks']], ['slow', 'fast'])
+        self.assertEqual(summary['hooks']['config-changed']['count'], 1)
+
+    def test_percentile(self):
+        self.assertIsNone(history.percentile([], 50))
+        self.assertEqual(history.percentile([3, 1, 2], 50), 2)
+        self.assertEqual(history.percentile([3, 1, 2], 100), 3)
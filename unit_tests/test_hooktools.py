@@ -0,0 +1,51 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+from mock import patch
+
+import charmhelpers.core.hookenv as hookenv
+
+import ops_openstack.hooktools as hooktools
+
+
+class TestHookTools(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        _p = patch.object(hookenv, 'is_leader', return_value=True)
+        self.is_leader = _p.start()
+        self.addCleanup(_p.stop)
+        _p = patch.dict(os.environ, {'JUJU_CONTEXT_ID': 'ctx-1'})
+        _p.start()
+        self.addCleanup(_p.stop)
+        hooktools.reset()
+
+    def test_is_leader(self):
+        self.assertTrue(hooktools.is_leader())
+        self.assertTrue(hooktools.is_leader())
+        self.assertEqual(self.is_leader.call_count, 1)
+        with patch.dict(os.environ, {'JUJU_CONTEXT_ID': 'ctx-2'}):
+            self.is_leader.return_value = False
+            self.assertFalse(hooktools.is_leader())
+        self.assertEqual(self.is_leader.call_count, 2)
+
+    def test_is_leader_no_context(self):
+        with patch.dict(os.environ):
+            del os.environ['JUJU_CONTEXT_ID']
+            hooktools.is_leader()
+            hooktools.is_leader()
+        self.assertEqual(self.is_leader.call_count, 2)
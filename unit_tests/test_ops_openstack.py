@@ -14,11 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import json
+import os
 import unittest
 
-from mock import patch, MagicMock
+from mock import call, patch, MagicMock
 
-from ops.testing import Harness
+from ops.testing import ActionFailed, Harness
 from ops.model import (
     ActiveStatus,
     BlockedStatus,
@@ -26,8 +29,11 @@ from ops.model import (
     WaitingStatus,
 )
 
+import ops_openstack.config
 import ops_openstack.core
 
+from unit_tests import patch_charm_dir
+
 
 class OpenStackTestPlugin1(ops_openstack.core.OSBaseCharm):
 
@@ -103,7 +109,7 @@ class CharmTestCase(unittest.TestCase):
 class TestOSBaseCharm(CharmTestCase):
 
     PATCHES = [
-        'add_source',
+        'ch_fetch',
         'apt_update',
         'apt_install',
         'os_utils']
@@ -128,6 +134,22 @@ class TestOSBaseCharm(CharmTestCase):
                     description: pause action
                 resume:
                     description: resume action
+                prefetch-packages:
+                    description: prefetch packages action
+                status-history:
+                    description: status history action
+                profile-report:
+                    description: profile report action
+                    params:
+                        hook:
+                            type: string
+                        count:
+                            type: integer
+                plan-config:
+                    description: plan config action
+                    params:
+                        config:
+                            type: string
             ''',
             config='''
                 options:
@@ -152,9 +174,12 @@ class TestOSBaseCharm(CharmTestCase):
                         default: False
                         description: yet another failure to report
             ''')
+        self.charm_dir = patch_charm_dir(self, OpenStackTestAPICharm)
 
     def tearDown(self):
         OpenStackTestAPICharm.MANDATORY_CONFIG = []
+        OpenStackTestAPICharm.CONFIG_SCHEMA = {}
+        OpenStackTestAPICharm.CONFIG_FILE_OPTIONS = {}
 
     def test_init(self):
         self.harness.begin()
@@ -166,7 +191,7 @@ class TestOSBaseCharm(CharmTestCase):
         print(self.harness._backend)
         self.harness.begin()
         self.harness.charm.on.install.emit()
-        self.assertFalse(self.add_source.called)
+        self.assertFalse(self.ch_fetch.add_source.called)
         self.apt_update.assert_called_once_with(fatal=True)
         self.apt_install.assert_called_once_with(
             ['keystone-common'],
@@ -179,11 +204,50 @@ class TestOSBaseCharm(CharmTestCase):
                 'key': 'akey'})
         self.harness.begin()
         self.harness.charm.on.install.emit()
-        self.add_source.assert_called_once_with('cloud:myppa', 'akey')
+        self.ch_fetch.add_source.assert_called_once_with(
+            'cloud:myppa', 'akey')
+        self.apt_update.assert_called_once_with(fatal=True)
+        self.apt_install.assert_called_once_with(
+            ['keystone-common'],
+            fatal=True)
+
+    def test_prefetch_packages_action(self):
+        self.harness.begin()
+        with patch.object(ops_openstack.core, '_apt_archive_size') as size:
+            size.side_effect = [100, 300, 300]
+            output = self.harness.run_action('prefetch-packages')
         self.apt_update.assert_called_once_with(fatal=True)
+        self.apt_install.assert_called_once_with(
+            ['keystone-common'],
+            options=['--download-only'],
+            fatal=True)
+        self.assertEqual(
+            output.results,
+            {'packages': 'keystone-common',
+             'downloaded-bytes': 200,
+             'cache-bytes': 300})
+
+    def test_install_prefetched(self):
+        self.harness.begin()
+        self.harness.charm.prefetch_pkgs()
+        self.apt_update.reset_mock()
+        self.apt_install.reset_mock()
+        self.harness.charm.on.install.emit()
+        self.assertFalse(self.apt_update.called)
         self.apt_install.assert_called_once_with(
             ['keystone-common'],
             fatal=True)
+        self.assertIsNone(self.harness.charm._stored.prefetched_source)
+
+    def test_install_prefetched_expired(self):
+        self.harness.begin()
+        with patch.object(ops_openstack.core.time, 'time') as mock_time:
+            mock_time.return_value = 1000
+            self.harness.charm.prefetch_pkgs()
+            self.apt_update.reset_mock()
+            mock_time.return_value = 1000 + 7 * 60 * 60
+            self.harness.charm.on.install.emit()
+        self.apt_update.assert_called_once_with(fatal=True)
 
     def test_update_status(self):
         self.os_utils.ows_check_services_running.return_value = (None, None)
@@ -312,30 +376,118 @@ class TestOSBaseCharm(CharmTestCase):
             set(['apache2', 'ks-api']))
 
     def test_pre_series_upgrade(self):
-        self.os_utils.manage_payload_services.return_value = ('a', 'b')
+        self.os_utils.manage_payload_services.return_value = (True, [])
         self.harness.begin()
         self.assertFalse(self.harness.charm._stored.series_upgrade)
         self.assertFalse(self.harness.charm._stored.is_paused)
         self.harness.charm.on.pre_series_upgrade.emit()
         self.assertTrue(self.harness.charm._stored.series_upgrade)
         self.assertTrue(self.harness.charm._stored.is_paused)
+        self.os_utils.manage_payload_services.assert_has_calls([
+            call('pause', services=['apache2'], charm_func=None),
+            call('pause', services=['ks-api'], charm_func=None)],
+            any_order=True)
+        self.assertEqual(
+            self.harness.charm._stored.series_upgrade_checkpoints['pause'],
+            ['apache2', 'ks-api'])
+        self.assertIn(
+            'pause',
+            self.harness.charm._stored.series_upgrade_timings)
+
+    def test_pre_series_upgrade_checkpoint(self):
+        self.os_utils.manage_payload_services.return_value = (True, [])
+        self.harness.begin()
+        charm = self.harness.charm
+        with patch.object(charm, '_stop_profiling') as stop_profiling:
+            charm.on.pre_series_upgrade.emit()
+            self.assertFalse(stop_profiling.called)
+            stored = self.harness.framework._storage.load_snapshot(
+                charm._stored._data.handle.path)
+            self.assertEqual(
+                stored['series_upgrade_checkpoints'],
+                {'pause': ['apache2', 'ks-api']})
+            self.harness.framework.commit()
+            stop_profiling.assert_called_once_with()
+
+    def test_pre_series_upgrade_resume_from_checkpoint(self):
+        self.os_utils.manage_payload_services.return_value = (True, [])
+        self.harness.begin()
+        self.harness.charm._stored.series_upgrade_checkpoints = {
+            'pause': ['apache2']}
+        self.harness.charm.on.pre_series_upgrade.emit()
         self.os_utils.manage_payload_services.assert_called_once_with(
             'pause',
-            services=self.harness.charm.services(),
+            services=['ks-api'],
             charm_func=None)
+        self.assertEqual(
+            self.harness.charm._stored.series_upgrade_checkpoints['pause'],
+            ['apache2', 'ks-api'])
+
+    def test_pre_series_upgrade_failure(self):
+        def _manage(action, services=None, charm_func=None):
+            if services == ['ks-api']:
+                raise RuntimeError('ks-api failed to stop')
+            return (True, [])
+
+        self.os_utils.manage_payload_services.side_effect = _manage
+        self.harness.begin()
+        with self.assertRaises(RuntimeError):
+            self.harness.charm.on.pre_series_upgrade.emit()
+        self.assertEqual(
+            self.harness.charm._stored.series_upgrade_checkpoints['pause'],
+            ['apache2'])
+
+    def test_pre_series_upgrade_unsuccessful(self):
+        self.os_utils.manage_payload_services.side_effect = (
+            lambda action, services=None, charm_func=None:
+            (services != ['ks-api'], ['ks-api is still running']))
+        self.harness.begin()
+        with self.assertRaisesRegex(RuntimeError, 'Failed to pause ks-api'):
+            self.harness.charm.on.pre_series_upgrade.emit()
+        self.assertFalse(self.harness.charm._stored.is_paused)
+        self.assertEqual(
+            self.harness.charm._stored.series_upgrade_checkpoints['pause'],
+            ['apache2'])
+
+    def test_post_series_upgrade_unsuccessful(self):
+        self.os_utils.manage_payload_services.side_effect = (
+            lambda action, services=None, charm_func=None:
+            (services != ['ks-api'], ['ks-api failed to start']))
+        self.harness.begin()
+        self.harness.charm._stored.series_upgrade = True
+        self.harness.charm._stored.is_paused = True
+        with self.assertRaisesRegex(RuntimeError, 'Failed to resume ks-api'):
+            self.harness.charm.on.post_series_upgrade.emit()
+        self.assertTrue(self.harness.charm._stored.series_upgrade)
+        self.assertTrue(self.harness.charm._stored.is_paused)
+        self.assertEqual(
+            self.harness.charm._stored.series_upgrade_checkpoints['resume'],
+            ['apache2'])
+        # Retrying the hook only resumes the service left pending.
+        self.os_utils.manage_payload_services.reset_mock()
+        self.os_utils.manage_payload_services.side_effect = None
+        self.os_utils.manage_payload_services.return_value = (True, [])
+        self.harness.charm.on.post_series_upgrade.emit()
+        self.os_utils.manage_payload_services.assert_called_once_with(
+            'resume', services=['ks-api'], charm_func=None)
+        self.assertFalse(self.harness.charm._stored.series_upgrade)
 
     def test_post_series_upgrade(self):
-        self.os_utils.manage_payload_services.return_value = ('a', 'b')
+        self.os_utils.manage_payload_services.return_value = (True, [])
         self.harness.begin()
         self.harness.charm._stored.series_upgrade = True
         self.harness.charm._stored.is_paused = True
+        self.harness.charm._stored.series_upgrade_checkpoints = {
+            'pause': ['apache2', 'ks-api']}
         self.harness.charm.on.post_series_upgrade.emit()
         self.assertFalse(self.harness.charm._stored.series_upgrade)
         self.assertFalse(self.harness.charm._stored.is_paused)
-        self.os_utils.manage_payload_services.assert_called_once_with(
-            'resume',
-            services=self.harness.charm.services(),
-            charm_func=None)
+        self.os_utils.manage_payload_services.assert_has_calls([
+            call('resume', services=['apache2'], charm_func=None),
+            call('resume', services=['ks-api'], charm_func=None)],
+            any_order=True)
+        self.assertEqual(
+            dict(self.harness.charm._stored.series_upgrade_checkpoints), {})
 
     def test_pause(self):
         self.os_utils.manage_payload_services.return_value = ('a', 'b')
@@ -368,3 +520,475 @@ class TestOSBaseCharm(CharmTestCase):
         self.harness.update_config({'source': 'value'})
         self.assertTrue(
             isinstance(self.harness.charm.unit.status, ActiveStatus))
+
+    def test_config_schema(self):
+        OpenStackTestAPICharm.CONFIG_SCHEMA = {
+            'source': ops_openstack.config.ConfigOption(
+                str, choices=['distro', 'cloud:jammy-caracal'])}
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        self.harness.begin()
+        self.harness.charm._stored.is_started = True
+        self.harness.update_config({'source': 'ppa:foo'})
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            BlockedStatus(
+                'Invalid configuration: source: must be one of distro, '
+                'cloud:jammy-caracal'))
+        self.harness.charm.on.update_status.emit()
+        self.assertIsInstance(
+            self.harness.charm.unit.status,
+            BlockedStatus)
+        self.harness.update_config({'source': 'distro'})
+        self.assertIsInstance(
+            self.harness.charm.unit.status,
+            ActiveStatus)
+
+    def test_validate_config_cached(self):
+        self.harness.begin()
+        result = self.harness.charm.validate_config()
+        self.assertIs(self.harness.charm.validate_config(), result)
+        self.harness.update_config({'source': 'distro'})
+        self.assertIsNot(self.harness.charm.validate_config(), result)
+
+    def test_config_observer(self):
+        self.harness.begin()
+        source = MagicMock()
+        checks = MagicMock()
+        self.harness.charm.register_config_observer('source', source)
+        self.harness.charm.register_config_observer(
+            ['custom-check-fail', 'plugin1-check-fail'], checks)
+        self.harness.update_config({'source': 'distro'})
+        self.assertTrue(self.harness.charm.config_delta.initial)
+        self.assertEqual(source.call_count, 1)
+        self.assertEqual(checks.call_count, 1)
+        self.harness.update_config({'custom-check-fail': True})
+        self.assertEqual(
+            self.harness.charm.config_delta.changed, {'custom-check-fail'})
+        self.assertEqual(source.call_count, 1)
+        self.assertEqual(checks.call_count, 2)
+        self.harness.charm.on.upgrade_charm.emit()
+        self.harness.update_config({})
+        self.assertEqual(source.call_count, 2)
+
+    def test_config_deferred(self):
+        self.harness.begin()
+        self.harness.update_config({'source': 'distro'})
+        deltas = []
+
+        def on_config(event):
+            deltas.append(self.harness.charm.config_delta)
+            if len(deltas) == 1:
+                event.defer()
+
+        observer = MagicMock()
+        self.harness.charm.register_config_observer('source', observer)
+        with patch.object(
+                self.harness.charm, 'on_config', side_effect=on_config):
+            self.harness.update_config({'source': 'cloud:jammy-caracal'})
+            self.assertFalse(observer.called)
+            self.harness.framework.reemit()
+        self.assertEqual(len(deltas), 2)
+        self.assertEqual(deltas[1].keys, {'source'})
+        observer.assert_called_once_with(deltas[1])
+        self.assertEqual(
+            self.harness.charm._stored.applied_config['source'],
+            'cloud:jammy-caracal')
+
+    def test_profile_hooks(self):
+        (self.charm_dir / '.profile-hooks').write_text('update-status')
+        _p = patch.object(
+            ops_openstack.core, 'PROFILE_ROOTS', (str(self.charm_dir),))
+        _p.start()
+        self.addCleanup(_p.stop)
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        # The same charm instance runs the action afterwards.
+        _p = patch.object(OpenStackTestAPICharm, 'FAST_DISPATCH_HOOKS', ())
+        _p.start()
+        self.addCleanup(_p.stop)
+        with patch.dict(os.environ, {'JUJU_HOOK_NAME': 'update-status'}):
+            self.harness.begin()
+            # The config and marker file are only read once per hook.
+            (self.charm_dir / '.profile-hooks').unlink()
+            self.harness.charm.PROFILE_KEEP = 1
+            self.harness.charm.on.update_status.emit()
+            self.harness.charm._on_commit(None)
+            self.harness.charm._start_profiling()
+            self.harness.charm._on_commit(None)
+        profile_dir = self.harness.charm.profile_dir
+        self.assertEqual(
+            profile_dir,
+            self.charm_dir / 'ops-openstack-profiles' /
+            'client-0')
+        profiles = list(profile_dir.glob('*.pstats'))
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].name.startswith('update-status-'))
+        output = self.harness.run_action(
+            'profile-report', {'hook': 'update-status', 'count': 5})
+        self.assertEqual(output.results['profile'], str(profiles[0]))
+        self.assertIn('cumulative', output.results['report'])
+
+    def test_profile_hooks_not_selected(self):
+        with patch.dict(os.environ, {'JUJU_HOOK_NAME': 'config-changed'}):
+            self.harness.update_config({'source': 'distro'})
+            self.harness.begin()
+        self.assertIsNone(self.harness.charm._profiler)
+
+    def test_status_history(self):
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        self.harness.begin()
+        self.harness.charm.on.update_status.emit()
+        with patch.dict(os.environ, {'JUJU_HOOK_NAME': 'update-status'}):
+            self.harness.charm._on_commit(None)
+        records = self.harness.charm.status_history.records()
+        self.assertEqual(records[0]['status'], 'waiting')
+        self.assertEqual(
+            [c[0] for c in records[0]['checks']],
+            ['check_config', 'plugin2_status_check', 'plugin1_status_check',
+             'custom_status_check', 'services'])
+        self.assertEqual(records[1]['name'], 'update-status')
+        output = self.harness.run_action('status-history')
+        summary = json.loads(output.results['summary'])
+        self.assertEqual(summary['evaluations'], 1)
+        self.assertEqual(summary['statuses'], {'waiting': 1})
+
+    def test_update_status_async_check(self):
+        async def async_check():
+            return BlockedStatus('Async check failed')
+
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        self.harness.begin()
+        self.harness.charm.register_status_check(async_check)
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            BlockedStatus('Async check failed'))
+
+    @patch.object(ops_openstack.core.dpkg, 'installed_versions')
+    def test_update_workload_version(self, installed_versions):
+        installed_versions.return_value = {
+            'keystone-common': '2:25.0.0-0ubuntu1'}
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.begin()
+        # Left to the charm unless VERSION_PACKAGE is set.
+        self.harness.charm.on.update_status.emit()
+        self.assertFalse(installed_versions.called)
+        self.harness.charm.VERSION_PACKAGE = 'keystone-common'
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(self.harness.get_workload_version(), '25.0.0')
+        installed_versions.assert_called_with(['keystone-common'])
+        with patch.object(
+                self.harness.charm.unit, 'set_workload_version') as set_ver:
+            self.harness.charm.on.update_status.emit()
+            self.assertFalse(set_ver.called)
+
+    def test_latency_probe(self):
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        self.harness.begin()
+        self.harness.charm._stored.is_started = True
+        self.harness.charm.register_latency_probe(
+            'api', MagicMock(), threshold=-1)
+        self.harness.charm.on.update_status.emit()
+        self.assertIsInstance(self.harness.charm.unit.status, ActiveStatus)
+        self.assertIn(
+            'degraded: api p95', self.harness.charm.unit.status.message)
+
+    def test_latency_probe_services_stopped(self):
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        self.harness.begin()
+        probe = MagicMock(side_effect=ConnectionRefusedError('refused'))
+        self.harness.charm.register_latency_probe('api', probe)
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            WaitingStatus('Charm configuration in progress'))
+        self.harness.charm._stored.is_started = True
+        self.harness.charm._stored.is_paused = True
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            MaintenanceStatus(
+                "Paused. Use 'resume' action to resume normal service."))
+        self.assertFalse(probe.called)
+        self.harness.charm._stored.is_paused = False
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            BlockedStatus('api not responding: refused'))
+
+    def test_expensive_status_check(self):
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        self.harness.begin()
+        self.harness.charm._stored.is_started = True
+        check = MagicMock(__name__='slow_check', return_value=ActiveStatus())
+        self.harness.charm.register_status_check(
+            check, cost=ops_openstack.core.EXPENSIVE_CHECK, interval=300)
+        with patch.object(ops_openstack.core.time, 'time') as mock_time, \
+                patch.object(ops_openstack.core.os, 'getloadavg') as load:
+            load.return_value = (64.0, 64.0, 64.0)
+            mock_time.return_value = 1000
+            self.harness.charm.on.update_status.emit()
+            mock_time.return_value = 1100
+            self.harness.charm.on.update_status.emit()
+            self.assertEqual(check.call_count, 1)
+            self.assertIsInstance(self.harness.charm.unit.status, ActiveStatus)
+            # Elapsed interval
+            mock_time.return_value = 1300
+            self.harness.charm.on.update_status.emit()
+            self.assertEqual(check.call_count, 2)
+            # Idle machine
+            load.return_value = (0.0, 0.0, 0.0)
+            self.harness.charm.on.update_status.emit()
+            self.assertEqual(check.call_count, 3)
+            # Non active result is checked again
+            load.return_value = (64.0, 64.0, 64.0)
+            check.return_value = BlockedStatus('too slow')
+            mock_time.return_value = 1600
+            self.harness.charm.on.update_status.emit()
+            self.assertEqual(
+                self.harness.charm.unit.status, BlockedStatus('too slow'))
+            check.return_value = ActiveStatus()
+            self.harness.charm.on.update_status.emit()
+            self.assertEqual(check.call_count, 5)
+            self.assertIsInstance(self.harness.charm.unit.status, ActiveStatus)
+        self.assertEqual(
+            self.harness.charm._stored.status_check_results['slow_check'],
+            {'time': 1600, 'duration': 0, 'status': 'active', 'message': ''})
+
+    def test_expensive_status_check_over_budget(self):
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        self.harness.begin()
+        self.harness.charm._stored.is_started = True
+        check = MagicMock(
+            __name__='slow_check', return_value=BlockedStatus('broken'))
+        self.harness.charm.register_status_check(
+            check, cost=ops_openstack.core.EXPENSIVE_CHECK, interval=300)
+        results = self.harness.charm._stored.status_check_results
+        # Non active results are checked again, whatever the budget.
+        results['slow_check'] = {
+            'time': 0, 'duration': 600, 'status': 'blocked',
+            'message': 'broken'}
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(check.call_count, 1)
+        results['slow_check'] = {
+            'time': 0, 'duration': 600, 'status': 'active', 'message': ''}
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(check.call_count, 1)
+        self.assertIsInstance(self.harness.charm.unit.status, ActiveStatus)
+
+    def test_fast_dispatch(self):
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        with patch.dict(os.environ, {'JUJU_HOOK_NAME': 'update-status'}):
+            self.harness.begin()
+            self.assertTrue(self.harness.charm.fast_dispatch)
+            self.harness.charm._stored.is_started = True
+            self.harness.charm.on.update_status.emit()
+            self.assertEqual(
+                self.harness.charm.unit.status.message,
+                'Unit is ready and super, Unit is ready and awesome')
+
+    def test_fast_dispatch_reemits_deferred(self):
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        with patch.dict(os.environ, {'JUJU_HOOK_NAME': 'update-status'}):
+            self.harness.begin()
+            self.harness.charm._stored.is_started = True
+            with patch.object(
+                    self.harness.charm, 'on_config',
+                    side_effect=lambda event: event.defer()):
+                self.harness.update_config({'source': 'distro'})
+            self.assertIsNone(self.harness.charm._stored.applied_config)
+            # ops re-emits deferred events before dispatching the hook's own.
+            self.harness.framework.reemit()
+            self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm._stored.applied_config['source'], 'distro')
+        self.assertIsInstance(self.harness.charm.unit.status, ActiveStatus)
+
+    def test_memory_report(self):
+        (self.charm_dir / '.memory-report-hooks').write_text('config-changed')
+        with patch.dict(os.environ, {'JUJU_HOOK_NAME': 'config-changed'}):
+            self.harness.begin()
+            self.assertTrue(ops_openstack.core.tracemalloc.is_tracing())
+            self.harness.update_config({'source': 'distro'})
+            with self.assertLogs('ops_openstack.core', 'INFO') as logs:
+                self.harness.charm._on_commit(None)
+        self.assertFalse(ops_openstack.core.tracemalloc.is_tracing())
+        self.assertRegex(
+            logs.output[0], 'Hook config-changed memory: .* KiB peak')
+        self.assertGreater(len(logs.output), 1)
+
+    def test_plan_config(self):
+        OpenStackTestAPICharm.CONFIG_FILE_OPTIONS = {
+            '/etc/f1.conf': ['source', 'key'],
+            '/etc/f2.conf': ['custom-check-fail']}
+        OpenStackTestAPICharm.MANDATORY_CONFIG = ['source']
+        self.harness.update_config({'source': 'distro'})
+        self.harness.begin()
+        output = self.harness.run_action(
+            'plan-config', {'config': json.dumps({'custom-check-fail': True})})
+        self.assertEqual(
+            json.loads(output.results['plan']),
+            {'changed': ['custom-check-fail'],
+             'valid': True,
+             'message': '',
+             'files': ['/etc/f2.conf', '/etc/f3.conf'],
+             'services': ['apache2', 'ks-api']})
+        self.assertFalse(self.harness.charm.model.config['custom-check-fail'])
+        self.assertEqual(
+            self.harness.charm.plan_config({'source': None}),
+            {'changed': ['source'],
+             'valid': False,
+             'message': 'Missing option(s): source',
+             'files': ['/etc/f1.conf', '/etc/f3.conf'],
+             'services': ['apache2']})
+        self.assertEqual(
+            self.harness.charm.plan_config({'source': 'distro'})['files'],
+            [])
+
+    def test_plan_config_invalid(self):
+        self.harness.begin()
+        with self.assertRaises(ActionFailed):
+            self.harness.run_action('plan-config', {'config': '{'})
+
+    def test_run_work(self):
+        self.harness.begin()
+        charm = self.harness.charm
+        slow = MagicMock()
+        charm.register_work('slow', slow, estimate=10)
+        charm.HOOK_BUDGET = 5
+        self.assertFalse(charm.run_work('slow'))
+        self.assertFalse(slow.called)
+        self.assertEqual(list(charm._stored.deferred_work), ['slow'])
+        # Deferred work runs when the next hook completes, and what it
+        # changed in stored state is committed.
+        charm.HOOK_BUDGET = 300
+        self.harness.framework.commit()
+        slow.assert_called_once_with()
+        stored = self.harness.framework._storage.load_snapshot(
+            charm._stored._data.handle.path)
+        self.assertEqual(stored['deferred_work'], [])
+        self.assertIn('slow', stored['work_durations'])
+
+    def test_run_work_deferred_fails(self):
+        self.harness.begin()
+        charm = self.harness.charm
+        charm.WORK_RETRIES = 1
+        broken = MagicMock(side_effect=ValueError('broken'))
+        charm.register_work('broken', broken, estimate=10)
+        charm.HOOK_BUDGET = 5
+        self.assertFalse(charm.run_work('broken'))
+        charm.HOOK_BUDGET = 300
+        with self.assertLogs('ops_openstack.core', 'ERROR') as logs:
+            self.harness.framework.commit()
+        self.assertIn('Deferred broken failed', logs.output[0])
+        self.assertEqual(list(charm._stored.deferred_work), ['broken'])
+        # Run again in the next hook, then dropped.
+        charm._deferred_work_run = False
+        with self.assertLogs('ops_openstack.core', 'ERROR') as logs:
+            self.harness.framework.commit()
+        self.assertIn('Dropping deferred broken', logs.output[0])
+        self.assertEqual(broken.call_count, 2)
+        self.assertEqual(list(charm._stored.deferred_work), [])
+        self.assertEqual(dict(charm._stored.work_failures), {})
+
+    def test_run_work_over_budget(self):
+        self.harness.begin()
+        charm = self.harness.charm
+        slow = MagicMock()
+        charm.register_work('slow', slow, estimate=600)
+        self.assertFalse(charm.run_work('slow'))
+        self.harness.framework.commit()
+        self.assertFalse(slow.called)
+        # Work which never fits the budget runs in update-status.
+        charm._deferred_work_run = False
+        with patch.dict(os.environ, {'JUJU_HOOK_NAME': 'update-status'}):
+            self.harness.framework.commit()
+        slow.assert_called_once_with()
+        self.assertEqual(list(charm._stored.deferred_work), [])
+
+    def test_run_work_overrun(self):
+        self.harness.begin()
+        charm = self.harness.charm
+        critical = MagicMock()
+        charm.register_work('critical', critical, critical=True)
+        charm.HOOK_BUDGET = -1
+        with self.assertLogs('ops_openstack.core', 'WARNING') as logs:
+            self.assertTrue(charm.run_work('critical'))
+        critical.assert_called_once_with()
+        self.assertRegex(logs.output[0], 'over its -1s budget after critical')
+
+    def test_update_status_async_check_timeout(self):
+        async def hung_check():
+            await asyncio.sleep(60)
+
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        self.harness.add_relation('shared-db', 'mysql')
+        self.harness.begin()
+        self.harness.charm.HOOK_BUDGET = 0
+        self.harness.charm.register_status_check(hung_check)
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            WaitingStatus('Status checks timed out: hung_check'))
+
+
+class TestGetCharmClass(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        _p = patch.dict(ops_openstack.core._releases, clear=True)
+        _p.start()
+        self.addCleanup(_p.stop)
+
+    def register(self, *releases):
+        classes = {}
+        for release in releases:
+            classes[release] = type(
+                release, (OpenStackTestAPICharm,), {'release': release})
+            ops_openstack.core.charm_class(classes[release])
+        return classes
+
+    def test_openstack_releases(self):
+        classes = self.register('yoga', 'antelope')
+        get_charm_class = ops_openstack.core.get_charm_class
+        self.assertIs(get_charm_class(), classes['antelope'])
+        self.assertIs(get_charm_class('zed'), classes['yoga'])
+        self.assertIs(get_charm_class('caracal'), classes['antelope'])
+        with self.assertRaises(RuntimeError):
+            get_charm_class('xena')
+        with self.assertRaises(RuntimeError):
+            get_charm_class('unknown')
+
+    def test_ceph_releases(self):
+        classes = self.register('quincy', 'reef')
+        get_charm_class = ops_openstack.core.get_charm_class
+        self.assertIs(get_charm_class('squid'), classes['reef'])
+        self.assertIs(get_charm_class('antelope'), classes['quincy'])
+        self.assertIs(get_charm_class('bobcat'), classes['reef'])
+
+    def test_all_releases(self):
+        classes = self.register('a', 'b')
+        self.assertIs(
+            ops_openstack.core.get_charm_class(
+                'c', all_releases=['b', 'a', 'c']),
+            classes['a'])
+
+    @patch.object(ops_openstack.core, 'os_utils')
+    @patch.object(ops_openstack.core, 'hookenv')
+    def test_get_charm_class_for_release(self, hookenv, os_utils):
+        classes = self.register('pacific', 'quincy')
+        hookenv.config.return_value = {'source': 'cloud:jammy-zed'}
+        os_utils.get_os_codename_install_source.return_value = 'zed'
+        self.assertIs(
+            ops_openstack.core.get_charm_class_for_release(),
+            classes['quincy'])
+        os_utils.get_os_codename_install_source.assert_called_once_with(
+            'cloud:jammy-zed')
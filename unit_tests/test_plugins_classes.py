@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import os
 import unittest
 
 from mock import patch
@@ -22,6 +24,7 @@ from ops.model import (
     BlockedStatus,
 )
 
+import ops_openstack.config
 import ops_openstack.plugins.classes
 
 
@@ -71,6 +74,13 @@ class TestBaseCephClientCharm(CharmTestCase):
                     description: pause action
                 resume:
                     description: resume action
+            ''',
+            config='''
+                options:
+                    bluestore-compression-mode:
+                        type: string
+                        default:
+                        description: compression mode
             ''')
         self.harness.add_relation('shared-db', 'mysql')
 
@@ -104,6 +114,29 @@ class TestBaseCephClientCharm(CharmTestCase):
             self.harness.charm.unit.status,
             BlockedStatus)
 
+    def test_bluestore_compression_computed_once(self):
+        self.ch_context.CephBlueStoreCompressionContext.return_value\
+            .get_kwargs.return_value = {'compression-mode': 'aggressive'}
+        self.harness.begin()
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm.bluestore_compression(),
+            {'compression-mode': 'aggressive'})
+        self.ch_context.CephBlueStoreCompressionContext\
+            .assert_called_once_with()
+
+    def test_bluestore_compression_changed(self):
+        kwargs = {'compression-mode': None}
+        self.ch_context.CephBlueStoreCompressionContext.return_value\
+            .get_kwargs.side_effect = lambda: dict(kwargs)
+        self.harness.begin()
+        self.assertTrue(self.harness.charm.bluestore_compression_changed())
+        self.harness.charm.bluestore_compression_sent()
+        self.assertFalse(self.harness.charm.bluestore_compression_changed())
+        kwargs['compression-mode'] = 'none'
+        self.harness.update_config({'bluestore-compression-mode': 'none'})
+        self.assertTrue(self.harness.charm.bluestore_compression_changed())
+
 
 class CinderCharm(ops_openstack.plugins.classes.CinderStoragePluginCharm):
 
@@ -143,3 +176,146 @@ class TestBaseCinderCharm(unittest.TestCase):
         config = self.harness.charm.cinder_configuration({})
         self.assertTrue(config[0], ('volume_driver', 'my-driver'))
         self.assertTrue(config[1], ('some-config', 'some-value'))
+        backend = self.harness.model.get_relation('storage-backend')
+        data = self.harness.get_relation_data(backend.id, 'cinder-test/0')
+        self.assertEqual(data['backend_name'], 'cinder-test')
+        self.assertEqual(data['stateless'], 'False')
+        self.assertEqual(data['active_active'], 'False')
+
+    def test_cinder_config_unchanged(self):
+        self.harness.update_config({})
+        with patch.object(self.harness.charm, 'set_data') as set_data:
+            self.harness.update_config({})
+            self.assertTrue(set_data.called)
+            set_data.reset_mock()
+            self.harness.charm.SKIP_UNCHANGED_CONFIG = True
+            self.harness.update_config({})
+            self.assertFalse(set_data.called)
+        self.assertTrue(isinstance(self.harness.model.unit.status,
+                                   ActiveStatus))
+
+    def test_storage_backend_coalesced(self):
+        backend = self.harness.model.get_relation('storage-backend')
+        with patch.object(self.harness.charm, 'set_data') as set_data, \
+                patch.dict(os.environ, {'JUJU_CONTEXT_ID': 'ctx-1'}):
+            self.harness.charm.on.storage_backend_relation_changed.emit(
+                backend)
+            self.harness.charm.on.storage_backend_relation_changed.emit(
+                backend)
+            self.assertEqual(set_data.call_count, 1)
+        self.assertEqual(
+            self.harness.charm._stored.coalesced_events['on_storage_backend'],
+            1)
+
+    def test_storage_backend_no_hook_context(self):
+        backend = self.harness.model.get_relation('storage-backend')
+        with patch.object(self.harness.charm, 'set_data') as set_data, \
+                patch.dict(os.environ):
+            os.environ.pop('JUJU_CONTEXT_ID', None)
+            self.harness.charm.on.storage_backend_relation_changed.emit(
+                backend)
+            self.harness.charm.on.storage_backend_relation_changed.emit(
+                backend)
+            self.assertEqual(set_data.call_count, 2)
+
+    def test_plan_config(self):
+        self.harness.update_config({})
+        backend = self.harness.model.get_relation('storage-backend')
+        with patch.object(
+                self.harness.charm, 'cinder_configuration',
+                side_effect=lambda config: [('pool', config.get('pool'))]):
+            plan = self.harness.charm.plan_config({'pool': 'fast'})
+        self.assertEqual(plan['changed'], ['pool'])
+        self.assertEqual(
+            plan['relation-writes'],
+            {'storage-backend:{}'.format(backend.id):
+             ['subordinate_configuration']})
+        self.assertNotIn(
+            'fast',
+            self.harness.get_relation_data(backend.id, 'cinder-test/0')[
+                'subordinate_configuration'])
+        self.assertEqual(
+            self.harness.charm.plan_config({})['relation-writes'], {})
+
+
+class SharedCinderCharm(CinderCharm):
+
+    PEER_RELATION = 'cluster'
+    SHARE_CINDER_CONFIGURATION = True
+
+
+class TestSharedCinderConfiguration(unittest.TestCase):
+
+    def setUp(self):
+        self.harness = Harness(
+            SharedCinderCharm,
+            meta='''
+            name: cinder-test
+            provides:
+                storage-backend:
+                    interface: cinder-backend
+                    scope: container
+            peers:
+                cluster:
+                    interface: cinder-test-peer
+            '''
+        )
+        self.addCleanup(self.harness.cleanup)
+        self.peers = self.harness.add_relation('cluster', 'cinder-test')
+        self.harness.begin()
+
+    def render(self, config):
+        # The shared values are computed once per charm instance.
+        self.harness.charm._shared.clear()
+        with patch.object(
+                self.harness.charm, 'cinder_configuration',
+                wraps=self.harness.charm.cinder_configuration) as compute:
+            rendered = json.loads(
+                self.harness.charm.render_config(config, 'cinder-test'))
+        return rendered, compute.call_count
+
+    def test_leader_publishes(self):
+        self.harness.set_leader(True)
+        rendered, computed = self.render({'pool': 'a'})
+        self.assertEqual(computed, 1)
+        self.assertEqual(
+            rendered['cinder']['/etc/cinder/cinder.conf']['sections'],
+            {'cinder-test': [['volume_driver', 'my-driver'],
+                             ['some-config', 'some-value']]})
+        published = json.loads(self.harness.get_relation_data(
+            self.peers, 'cinder-test')['shared-cinder-configuration'])
+        self.assertEqual(
+            published['digest'], ops_openstack.config.config_digest(
+                {'pool': 'a'}))
+        self.assertEqual(self.render({'pool': 'a'}), (rendered, 0))
+
+    def test_not_shared(self):
+        self.harness.set_leader(True)
+        with patch.object(
+                SharedCinderCharm, 'SHARE_CINDER_CONFIGURATION', False):
+            rendered, computed = self.render({'pool': 'a'})
+            self.assertEqual(self.render({'pool': 'a'}), (rendered, 1))
+        self.assertEqual(computed, 1)
+        self.assertNotIn(
+            'shared-cinder-configuration',
+            self.harness.get_relation_data(self.peers, 'cinder-test'))
+
+    def test_non_leader_consumes(self):
+        self.harness.update_relation_data(
+            self.peers, 'cinder-test', {
+                'shared-cinder-configuration': json.dumps({
+                    'digest': ops_openstack.config.config_digest(
+                        {'pool': 'a'}),
+                    'value': [['volume_driver', 'leader-driver']]})})
+        rendered, computed = self.render({'pool': 'a'})
+        self.assertEqual(computed, 0)
+        self.assertEqual(
+            rendered['cinder']['/etc/cinder/cinder.conf']['sections'],
+            {'cinder-test': [['volume_driver', 'leader-driver']]})
+        # Stale data, the leader has not seen the new config yet.
+        rendered, computed = self.render({'pool': 'b'})
+        self.assertEqual(computed, 1)
+        self.assertEqual(
+            rendered['cinder']['/etc/cinder/cinder.conf']['sections'],
+            {'cinder-test': [['volume_driver', 'my-driver'],
+                             ['some-config', 'some-value']]})
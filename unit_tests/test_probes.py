@@ -0,0 +1,82 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.server
+import threading
+import unittest
+
+from mock import MagicMock, patch
+
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+)
+
+import ops_openstack.probes as probes
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_HEAD(self):
+        self.send_response(401)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestLatencyProbe(unittest.TestCase):
+
+    def probe(self, latencies, threshold):
+        clock = []
+        for latency in latencies:
+            clock.extend([0, latency / 1000.0])
+        probe = probes.LatencyProbe(
+            'api', MagicMock(), samples=len(latencies), threshold=threshold)
+        with patch.object(probes.time, 'monotonic', side_effect=clock):
+            return probe()
+
+    def test_within_threshold(self):
+        self.assertEqual(
+            self.probe([10, 20, 30, 40], threshold=50), ActiveStatus())
+
+    def test_degraded(self):
+        self.assertEqual(
+            self.probe([10, 20, 30, 400], threshold=lambda: 50),
+            ActiveStatus('degraded: api p95 400ms'))
+
+    def test_outlier(self):
+        self.assertEqual(
+            self.probe([10] * 19 + [400], threshold=50), ActiveStatus())
+
+    def test_failed(self):
+        probe = probes.LatencyProbe(
+            'api', MagicMock(side_effect=ConnectionRefusedError('refused')))
+        self.assertEqual(probe(), BlockedStatus('api not responding: refused'))
+        self.assertEqual(probe.__name__, 'api_probe')
+
+    def test_http_head(self):
+        server = http.server.HTTPServer(('127.0.0.1', 0), _Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        probe = probes.LatencyProbe(
+            'api',
+            probes.http_head('http://127.0.0.1:{}/'.format(
+                server.server_address[1])),
+            samples=3)
+        self.assertEqual(probe(), ActiveStatus())
+        self.assertEqual(len(probe.latencies), 3)
@@ -0,0 +1,41 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import MagicMock
+
+from ops_openstack.relations import RelationDataBatch
+
+
+class TestRelationDataBatch(unittest.TestCase):
+
+    def test_flush(self):
+        bag1 = MagicMock()
+        bag2 = MagicMock()
+        with RelationDataBatch() as batch:
+            batch.bag(bag1)['a'] = '1'
+            batch.bag(bag1)['b'] = '2'
+            batch.bag(bag2)
+            self.assertFalse(bag1.update.called)
+        bag1.update.assert_called_once_with({'a': '1', 'b': '2'})
+        self.assertFalse(bag2.update.called)
+
+    def test_not_flushed_on_error(self):
+        bag = MagicMock()
+        with self.assertRaises(ValueError):
+            with RelationDataBatch() as batch:
+                batch.bag(bag)['a'] = '1'
+                raise ValueError()
+        self.assertFalse(bag.update.called)
@@ -0,0 +1,53 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import ops_openstack.releases as releases
+
+
+class TestReleases(unittest.TestCase):
+
+    def test_ordinals_unique(self):
+        for ordinals in releases.ORDINALS.values():
+            self.assertEqual(
+                len(set(ordinals.values())), len(ordinals))
+        self.assertFalse(
+            set(releases.OPENSTACK_ORDINALS) & set(releases.CEPH_ORDINALS))
+
+    def test_uca_map_ordered(self):
+        # Later OpenStack releases never ship an older Ceph release.
+        ceph = [
+            releases.ordinal(releases.UCA_CODENAME_MAP[r])
+            for r in sorted(releases.UCA_CODENAME_MAP,
+                            key=releases.ordinal)]
+        self.assertEqual(ceph, sorted(ceph))
+
+    def test_ordinal(self):
+        self.assertLess(releases.ordinal('zed'), releases.ordinal('antelope'))
+        self.assertLess(releases.ordinal('pacific'), releases.ordinal('reef'))
+        with self.assertRaises(KeyError):
+            releases.ordinal('unknown')
+
+    def test_track(self):
+        self.assertEqual(releases.track('caracal'), releases.OPENSTACK)
+        self.assertEqual(releases.track('squid'), releases.CEPH)
+        self.assertIsNone(releases.track('unknown'))
+
+    def test_to_track(self):
+        self.assertEqual(
+            releases.to_track('caracal', releases.CEPH), 'squid')
+        self.assertEqual(
+            releases.to_track('squid', releases.CEPH), 'squid')
+        self.assertIsNone(releases.to_track('squid', releases.OPENSTACK))
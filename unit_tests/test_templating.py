@@ -0,0 +1,101 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from mock import patch
+
+import jinja2
+
+import ops_openstack.templating as templating
+
+
+class TestTemplating(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.templates_dir = os.path.join(self.tmp.name, 'templates')
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        os.mkdir(self.templates_dir)
+        self.write_template('app.conf', 'debug = {{ options.debug }}\n')
+        self.target = os.path.join(self.tmp.name, 'etc', 'app.conf')
+        patcher = patch.object(templating, '_environments', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_template(self, name, content):
+        with open(os.path.join(self.templates_dir, name), 'w') as f:
+            f.write(content)
+
+    def read_target(self):
+        with open(self.target) as f:
+            return f.read()
+
+    def cache_files(self):
+        return [name
+                for _, _, names in os.walk(self.cache_dir)
+                for name in names]
+
+    def render(self, context):
+        return templating.render(
+            'app.conf', self.target, context, self.templates_dir,
+            self.cache_dir)
+
+    def test_get_environment(self):
+        env = templating.get_environment(self.templates_dir, self.cache_dir)
+        self.assertIs(
+            templating.get_environment(self.templates_dir, self.cache_dir),
+            env)
+        self.assertIsInstance(
+            env.bytecode_cache, jinja2.FileSystemBytecodeCache)
+        self.assertIsNone(
+            templating.get_environment(self.templates_dir).bytecode_cache)
+
+    def test_get_environment_prunes_other_versions(self):
+        stale = os.path.join(self.cache_dir, '0-jinja1.0')
+        os.makedirs(stale)
+        templating.get_environment(self.templates_dir, self.cache_dir)
+        self.assertEqual(
+            os.listdir(self.cache_dir),
+            ['{}-jinja{}'.format(
+                templating.CACHE_VERSION, jinja2.__version__)])
+
+    def test_render(self):
+        self.assertTrue(self.render({'options': {'debug': True}}))
+        self.assertEqual(self.read_target(), 'debug = True')
+        self.assertEqual(os.stat(self.target).st_mode & 0o777, 0o444)
+        self.assertEqual(len(self.cache_files()), 1)
+        # Unchanged contents are not written again.
+        self.assertFalse(self.render([('options', {'debug': True})]))
+        self.assertTrue(self.render({'options': {'debug': False}}))
+        self.assertEqual(self.read_target(), 'debug = False')
+
+    def test_render_uses_cache(self):
+        self.render({'options': {'debug': True}})
+        # A new process, with the compiled template on disk.
+        templating._environments.clear()
+        with patch.object(jinja2.Environment, 'compile') as compile:
+            self.render({'options': {'debug': False}})
+        compile.assert_not_called()
+        self.assertEqual(self.read_target(), 'debug = False')
+
+    def test_render_template_changed(self):
+        self.render({'options': {'debug': True}})
+        templating._environments.clear()
+        self.write_template('app.conf', 'verbose = {{ options.debug }}\n')
+        self.render({'options': {'debug': True}})
+        self.assertEqual(self.read_target(), 'verbose = True')
@@ -0,0 +1,143 @@
+# Copyright 2020 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pathlib
+import tempfile
+import types
+import unittest
+
+from mock import MagicMock, patch
+
+from ops.model import ActiveStatus
+from ops.testing import Harness
+
+import ops_openstack.core
+import ops_openstack.trace as trace
+
+from unit_tests import patch_charm_dir
+
+META = '''
+name: client
+requires:
+  shared-db:
+    interface: mysql-shared
+'''
+
+
+class TracedCharm(ops_openstack.core.OSBaseCharm):
+
+    REQUIRED_RELATIONS = ['shared-db']
+
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.module = types.SimpleNamespace(
+            lookup=MagicMock(__name__='lookup', __module__='fake'))
+        self.targets = [('fake_module', 'lookup')]
+        _p = patch.dict('sys.modules', {'fake_module': self.module})
+        _p.start()
+        self.addCleanup(_p.stop)
+
+    def test_record_and_play(self):
+        original = self.module.lookup
+        original.side_effect = [('a', 1), ('b', 2), ValueError('gone')]
+        with trace.Recorder(self.targets) as recorder:
+            self.assertEqual(self.module.lookup('x'), ('a', 1))
+            self.assertEqual(self.module.lookup('x'), ('b', 2))
+            with self.assertRaises(ValueError):
+                self.module.lookup('y', fatal=True)
+        self.assertIs(self.module.lookup, original)
+        self.assertEqual(len(recorder.calls), 3)
+
+        with trace.Player(recorder.calls, self.targets) as player:
+            self.assertEqual(self.module.lookup('x'), ['a', 1])
+            self.assertEqual(self.module.lookup('x'), ['b', 2])
+            # The last response is repeated.
+            self.assertEqual(self.module.lookup('x'), ['b', 2])
+            with self.assertRaisesRegex(trace.TraceError, 'ValueError: gone'):
+                self.module.lookup('y', fatal=True)
+            with self.assertRaisesRegex(
+                    trace.TraceError, 'No recorded call to fake.lookup'):
+                self.module.lookup('z')
+        self.assertEqual(player.misses, 1)
+        self.assertEqual(original.call_count, 3)
+
+    def test_write_load(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = pathlib.Path(tmpdir.name) / 'hook.trace'
+        trace.write(path, {'version': trace.TRACE_VERSION, 'calls': []})
+        self.assertEqual(trace.load(path)['calls'], [])
+        self.assertEqual(path.stat().st_mode & 0o777, 0o600)
+        trace.write(path, {'version': 0})
+        with self.assertRaises(ValueError):
+            trace.load(path)
+
+    def test_stored_snapshot(self):
+        stored = types.SimpleNamespace(a={'x': {2, 1}}, b=[1])
+        self.assertEqual(
+            trace.stored_snapshot(stored, ['a', 'b', 'c']),
+            {'a': {'x': [1, 2]}, 'b': [1]})
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        _p = patch.object(ops_openstack.core, 'os_utils')
+        self.os_utils = _p.start()
+        self.addCleanup(_p.stop)
+        self.charm_dir = patch_charm_dir(self, TracedCharm)
+        (self.charm_dir / '.record-hooks').write_text('update-status')
+
+    def record(self):
+        harness = Harness(TracedCharm, meta=META)
+        self.addCleanup(harness.cleanup)
+        rid = harness.add_relation('shared-db', 'mysql')
+        harness.add_relation_unit(rid, 'mysql/0')
+        harness.update_relation_data(rid, 'mysql/0', {'host': '10.0.0.1'})
+        harness.begin()
+        harness.charm._stored.is_started = True
+        with patch.dict(os.environ, {'JUJU_HOOK_NAME': 'update-status'}):
+            harness.charm._start_recording()
+            harness.charm.on.update_status.emit()
+            harness.charm._on_commit(None)
+        self.assertIsInstance(harness.charm.unit.status, ActiveStatus)
+        traces = list((self.charm_dir / '.traces').glob('*.trace'))
+        self.assertEqual(len(traces), 1)
+        return traces[0]
+
+    def test_replay(self):
+        self.os_utils.ows_check_services_running.return_value = (None, None)
+        path = self.record()
+        recorded = trace.load(path)
+        self.assertEqual(recorded['env']['JUJU_HOOK_NAME'], 'update-status')
+        self.assertEqual(
+            recorded['relations'][0]['units'],
+            {'mysql/0': {'host': '10.0.0.1'}})
+        self.assertTrue(recorded['stored']['is_started'])
+        self.assertEqual(recorded['stored']['deferred_work'], [])
+        self.assertEqual(len(recorded['calls']), 1)
+
+        # The recorded response is used rather than the live one.
+        self.os_utils.ows_check_services_running.return_value = (
+            None, 'Services not running')
+        result = trace.replay(TracedCharm, path, meta=META)
+        self.assertEqual(result.status, ActiveStatus('Unit is ready'))
+        self.assertEqual(result.hook, 'update-status')
+        self.assertEqual(result.calls, 1)
+        self.assertEqual(result.misses, 0)
+        self.assertEqual(
+            self.os_utils.ows_check_services_running.call_count, 1)